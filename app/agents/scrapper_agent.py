@@ -1,7 +1,9 @@
+import os
+from functools import lru_cache
 from core.builders.agent_builder import Agent
 from core.executors.runnable_executor import RunnableExecutor
 from core.executors.runnable_withmemory_executor import RunnableWithMemoryExecutor
-from langchain_openai import ChatOpenAI
+from core.builders.model_pool import ModelPool
 
 # Define the system prompt for the scrapper agent
 scrapper_prompt = ("""
@@ -13,16 +15,31 @@ scrapper_tools = ["simpletool"]
 
 scrapper_history = True
 
-# Create an instance of the Agent class with the specified parameters and create the agent
-scrapper_agent = Agent(
-    name="scrapper",
-    system_prompt=scrapper_prompt,
-    conversation_history=scrapper_history,
-    llm=ChatOpenAI(model="gpt-4o-mini"),
-    tools=scrapper_tools
-).create()
-
-if scrapper_history:
-    scrapper = RunnableWithMemoryExecutor(scrapper_agent)
-else:
-    scrapper = RunnableExecutor(scrapper_agent)
\ No newline at end of file
+@lru_cache(maxsize=None)
+def get_scrapper() -> RunnableExecutor:
+    # Build the agent on first use, so importing this module does not load the model provider or the tools
+    scrapper_agent = Agent(
+        name="scrapper",
+        system_prompt=scrapper_prompt,
+        conversation_history=scrapper_history,
+        llm=ModelPool.get("gpt-4o-mini"),
+        tools=scrapper_tools,
+        execute_tools=True
+    ).create()
+
+    # Optional micro-batching window (seconds) to coalesce concurrent sessions into abatch calls when serving;
+    # the agent runnable has no native abatch, so leave it unset unless that changes
+    batch_window = float(os.environ["AGENT_BATCH_WINDOW"]) if os.environ.get("AGENT_BATCH_WINDOW") else None
+
+    if scrapper_history:
+        return RunnableWithMemoryExecutor(scrapper_agent, batch_window=batch_window)
+    return RunnableExecutor(scrapper_agent, batch_window=batch_window)
+
+# The agent is rebuilt on the models of a reopened ModelPool
+ModelPool.on_close(get_scrapper.cache_clear)
+
+def __getattr__(name: str):
+    # Keeps `from app.agents.scrapper_agent import scrapper` working, building the agent at that point
+    if name == "scrapper":
+        return get_scrapper()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,12 +3,17 @@ from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field
 from typing import Optional, Union, Type
 from loguru import logger
+from core.builders.tool_cache import cacheable
+from core.builders.tool_execution import execution_mode
 
 # Define a Pydantic model for the input schema of the tool
 class SimpleToolScriptInput(BaseModel):
     name: str = Field(description="Person's name")
 
-# Define a tool class that greets a user by name
+# Define a tool class that greets a user by name; the greeting is deterministic, so its results are cached,
+# and cheap, so it runs on the event loop
+@cacheable(ttl=3600)
+@execution_mode("inline")
 class SimpleTool(BaseTool):
     # Set the name and description of the tool
     name: str = "simpletool"
@@ -1 +1,51 @@
-# TODO: create the graph with the scrapper_runnable and tool_node with all tools
\ No newline at end of file
+from typing import Optional
+from core.builders.agent_builder import define_agent
+from core.executors.graph_executor import AgentGraph, Checkpointer, END, START
+
+# The scrapper researches the theme running its tools itself, so no separate tool node is needed.
+# The summary and the fact check are independent and run concurrently; the writer joins both.
+researcher_prompt = ("""
+                You're an assistant to get information in the web from the specific theme that the user sends to you
+                """)
+
+summarizer_prompt = ("""
+                You summarize the information found in the conversation in a few short paragraphs
+                """)
+
+fact_checker_prompt = ("""
+                You point out the claims of the conversation that are doubtful or contradict each other
+                """)
+
+writer_prompt = ("""
+                You write the final answer to the user from the summary and the fact check in the conversation
+                """)
+
+def has_findings(state) -> str:
+    # Skip the rest of the graph when the research produced nothing
+    last_message = state["messages"][-1]
+    return "found" if last_message.content else "empty"
+
+def build_graph(model: str = "gpt-4o-mini", checkpointer: Optional[Checkpointer] = None) -> AgentGraph:
+    """
+    Builds the research graph. The agents are defined without history, the graph state carries the
+    conversation between them.
+
+    Args:
+        model (str, optional): Model used by every agent. Default is gpt-4o-mini.
+        checkpointer (Checkpointer, optional): Store of the checkpoints, to resume failed runs.
+
+    Returns:
+        AgentGraph: The graph, to run with ainvoke({"messages": [HumanMessage(...)]}).
+    """
+    graph = AgentGraph(checkpointer=checkpointer)
+    graph.add_node("researcher", define_agent("researcher", researcher_prompt, False, model, ["simpletool"],
+                                              agent_execute_tools=True))
+    graph.add_node("summarizer", define_agent("summarizer", summarizer_prompt, False, model, []))
+    graph.add_node("fact_checker", define_agent("fact_checker", fact_checker_prompt, False, model, []))
+    graph.add_node("writer", define_agent("writer", writer_prompt, False, model, []))
+
+    graph.add_edge(START, "researcher")
+    graph.add_conditional_edges("researcher", has_findings, {"found": ["summarizer", "fact_checker"], "empty": END})
+    graph.add_edge(["summarizer", "fact_checker"], "writer")
+    graph.add_edge("writer", END)
+    return graph
@@ -0,0 +1,297 @@
+"""
+Offline benchmark of the framework overhead: no provider, no MongoDB server.
+
+The model is a deterministic fake chat model with a configurable latency that asks for a configurable
+number of tool calls per turn; the history lives in mongomock, an in-process MongoDB stand-in
+(pip install mongomock). Every scenario reports throughput, p50/p99 turn latency and the per-stage
+breakdown of the MetricsRegistry, as JSON that can be compared between versions:
+
+    python -m bench.executor_bench --output bench_output.json
+    python -m bench.executor_bench --quick --baseline bench_output.json
+"""
+import argparse, asyncio, itertools, json, math, platform, statistics, subprocess, sys, time
+from typing import Any, Dict, List, Optional
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from loguru import logger
+from core.builders.agent_builder import Agent
+from core.builders.prompt_builder import PromptBuilder
+from core.builders.tool_manager import TOOLS_PACKAGE, ToolManager, ToolRegistry
+from core.executors.request_scheduler import RequestScheduler, ScheduledModel
+from core.executors.runnable_executor import RunnableExecutor
+from core.executors.runnable_withmemory_executor import RunnableWithMemoryExecutor
+from core.executors.tool_call_executor import ToolCallExecutor
+from core.memory.mongo_chat_history import CustomMongoDBChatMessageHistory
+from core.utils.metrics import MetricsRegistry
+
+# History loading modes of the memory executor: everything, a window of recent messages, or a token budget
+HISTORY_MODES = {
+    "full": {},
+    "window": {"history_size": 20},
+    "budget": {"max_history_tokens": 500},
+}
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model for benchmarks. Each turn first asks for fan_out tool calls, when fan_out is
+    above zero, then answers once the tool results are in the conversation.
+
+    Attributes:
+        latency (float): Seconds each call takes.
+        fan_out (int): Number of tool calls requested per turn.
+        tool_name (str): Tool the calls go to.
+        answer_tokens (int): Number of words of the answer.
+    """
+    latency: float = 0.0
+    fan_out: int = 0
+    tool_name: str = "simpletool"
+    answer_tokens: int = 20
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-bench"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def __respond(self, messages: List[BaseMessage]) -> ChatResult:
+        last = messages[-1]
+        if self.fan_out and not isinstance(last, ToolMessage):
+            # Unique arguments per turn, so the tool result cache does not answer the calls
+            turn = len(messages)
+            message = AIMessage(content="", tool_calls=[
+                {"name": self.tool_name, "args": {"name": f"{turn}-{index}-{last.content}"}, "id": f"call_{turn}_{index}"}
+                for index in range(self.fan_out)
+            ])
+        else:
+            message = AIMessage(content=" ".join(["token"] * self.answer_tokens))
+        prompt_tokens = sum(len(str(m.content)) // 4 for m in messages)
+        message.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": self.answer_tokens,
+                                  "total_tokens": prompt_tokens + self.answer_tokens}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.__respond(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.__respond(messages)
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Returns the q-th percentile (0-100) of the values, by nearest rank.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+def build_runnable(fan_out: int, latency: float, history: bool):
+    """
+    Builds an agent runnable like Agent.create does, on the fake model, bypassing the memoization.
+    """
+    model = FakeChatModel(latency=latency, fan_out=fan_out)
+    prompt = PromptBuilder.create(system_prompt="You are a benchmark agent", conversation_history=history)
+    runnable = prompt | ScheduledModel(model, RequestScheduler.shared()).as_runnable()
+    runnable.name = "bench"
+    if fan_out:
+        runnable = ToolCallExecutor(runnable, ToolManager().get_tool(["simpletool"]), max_iterations=2).as_runnable()
+    return runnable
+
+def seed_history(client, sessions: int, history_length: int) -> None:
+    """
+    Stores history_length messages in each session before the run.
+    """
+    for session in range(sessions):
+        history = CustomMongoDBChatMessageHistory(connection_string=None, session_id=f"session-{session}", client=client)
+        history.add_messages([
+            HumanMessage(content=f"question {index}") if index % 2 == 0 else AIMessage(content=f"answer {index}")
+            for index in range(history_length)
+        ])
+
+async def run_scenario(executor_type: str, sessions: int, history_length: int, fan_out: int, turns: int,
+                       latency: float, history_mode: str = "full") -> Dict[str, Any]:
+    """
+    Runs `turns` sequential turns in each of `sessions` concurrent sessions and measures every turn.
+    history_mode picks how the memory executor loads the history, see HISTORY_MODES.
+
+    Returns:
+        Dict[str, Any]: Parameters, throughput, latency percentiles and per-stage metrics.
+    """
+    MetricsRegistry.shared().reset()
+    if executor_type == "memory":
+        import mongomock
+        client = mongomock.MongoClient()
+        seed_history(client, sessions, history_length)
+        executor = RunnableWithMemoryExecutor(build_runnable(fan_out, latency, history=True), mongo_client=client,
+                                              **HISTORY_MODES[history_mode])
+    else:
+        executor = RunnableExecutor(build_runnable(fan_out, latency, history=False))
+
+    latencies: List[float] = []
+    failures = 0
+
+    async def session(index: int) -> None:
+        nonlocal failures
+        config = {"configurable": {"session_id": f"session-{index}"}}
+        for turn in range(turns):
+            start = time.perf_counter()
+            result = await executor({"messages": [HumanMessage(content=f"s{index}t{turn}")]}, config)
+            latencies.append(time.perf_counter() - start)
+            # The executors answer failures with a message instead of raising, so they are counted here
+            if result["messages"].content == "I cannot resolve the task. Retry.":
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[session(index) for index in range(sessions)])
+    elapsed = time.perf_counter() - start
+
+    stages = [{key: value for key, value in stage.items() if key not in ("sum", "p95")}
+              for stage in MetricsRegistry.shared().to_json()["stages"]]
+    name = f"{executor_type}/sessions={sessions}/history={history_length}/fan_out={fan_out}"
+    if history_mode != "full":
+        name += f"/history_mode={history_mode}"
+    return {
+        "name": name,
+        "executor": executor_type,
+        "history_mode": history_mode,
+        "sessions": sessions,
+        "history_length": history_length,
+        "fan_out": fan_out,
+        "turns": len(latencies),
+        "failures": failures,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.fmean(latencies),
+        "stages": stages,
+    }
+
+def bench_tool_discovery(repeat: int) -> Dict[str, Any]:
+    """
+    Measures the cold scan of the tools folder and the warm lookups of ToolManager.
+    """
+    cold = []
+    for _ in range(repeat):
+        ToolRegistry.reset()
+        # Forget the tool modules too, so every cold sample pays their imports like a fresh process
+        for module in [name for name in sys.modules if name.startswith(f"{TOOLS_PACKAGE}.")]:
+            del sys.modules[module]
+        start = time.perf_counter()
+        ToolManager().get_tool(["simpletool"])
+        cold.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ToolManager().get_tool(["simpletool"])
+    warm = (time.perf_counter() - start) / repeat
+    return {"name": "tool_manager/discovery", "cold_p50": percentile(cold, 50), "cold_max": max(cold), "warm_mean": warm}
+
+def bench_agent_create(repeat: int) -> Dict[str, Any]:
+    """
+    Measures Agent.create when the runnable is built and when it is memoized.
+    """
+    llm = FakeChatModel()
+    agent = Agent(name="bench", system_prompt="You are a benchmark agent", conversation_history=True, llm=llm,
+                  tools=["simpletool"], execute_tools=True)
+    cold = []
+    for _ in range(repeat):
+        Agent._compiled.pop(agent.key(), None)
+        start = time.perf_counter()
+        agent.create()
+        cold.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        agent.create()
+    warm = (time.perf_counter() - start) / repeat
+    return {"name": "agent/create", "cold_p50": percentile(cold, 50), "cold_max": max(cold), "warm_mean": warm}
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> List[Dict[str, Any]]:
+    """
+    Compares the scenarios with a previous output: ratios above 1 mean the current version is slower.
+    """
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = {result["name"]: result for result in json.load(file)["results"]}
+    comparison = []
+    for result in results:
+        previous = baseline.get(result["name"])
+        if previous is None:
+            continue
+        ratios = {key: result[key] / previous[key]
+                  for key in ("p50", "p99", "cold_p50", "warm_mean")
+                  if result.get(key) and previous.get(key)}
+        if result.get("throughput") and previous.get("throughput"):
+            ratios["throughput"] = result["throughput"] / previous["throughput"]
+        comparison.append({"name": result["name"], **ratios})
+    return comparison
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    grid = {
+        "executor": args.executors,
+        "sessions": args.sessions,
+        "history": args.history,
+        "fan_out": args.fan_out,
+        "history_mode": args.history_modes,
+    }
+    results = [bench_tool_discovery(args.repeat), bench_agent_create(args.repeat)]
+    for executor_type, sessions, history_length, fan_out, history_mode in itertools.product(*grid.values()):
+        if executor_type == "plain" and (history_length or history_mode != "full"):
+            # The plain executor has no history, the history settings would only repeat the scenario
+            continue
+        result = await run_scenario(executor_type, sessions, history_length, fan_out, args.turns, args.latency,
+                                    history_mode)
+        logger.info(f"[BENCH] {result['name']}: {result['throughput']:.1f} turns/s, "
+                    f"p50 {result['p50'] * 1000:.2f}ms, p99 {result['p99'] * 1000:.2f}ms")
+        if result["failures"]:
+            logger.warning(f"[BENCH] {result['name']}: {result['failures']} of {result['turns']} turns failed.")
+        results.append(result)
+
+    output = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "parameters": {**grid, "turns": args.turns, "latency": args.latency, "repeat": args.repeat},
+        "results": results,
+    }
+    if args.baseline:
+        output["comparison"] = compare(results, args.baseline)
+    return output
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the executors")
+    parser.add_argument("--executors", nargs="+", choices=["plain", "memory"], default=["plain", "memory"])
+    parser.add_argument("--sessions", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--history", nargs="+", type=int, default=[0, 50, 200])
+    parser.add_argument("--fan-out", nargs="+", type=int, default=[0, 2, 8])
+    parser.add_argument("--history-modes", nargs="+", choices=list(HISTORY_MODES), default=list(HISTORY_MODES),
+                        help="How the memory executor loads the history: all of it, a window or a token budget")
+    parser.add_argument("--turns", type=int, default=10, help="Sequential turns per session")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per fake model call")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions of the discovery and create benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Small grid for a smoke run")
+    parser.add_argument("--baseline", help="Previous output to compare with")
+    parser.add_argument("--output", help="Write the JSON here instead of stdout")
+    args = parser.parse_args()
+    if args.quick:
+        args.sessions, args.history, args.fan_out, args.turns, args.repeat = [1, 8], [0, 50], [0, 2], 3, 5
+
+    # Framework debug logs would dominate the measurements
+    logger.remove()
+    logger.add(sys.stderr, level="INFO")
+
+    output = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(output, file, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
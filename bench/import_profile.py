@@ -0,0 +1,101 @@
+"""
+Import-time profile of the entry modules, to keep the cold start of CLI runs and short-lived workers in check.
+
+Each module is imported in a fresh interpreter with -X importtime. The script reports the median import
+time, the slowest modules it pulls in, and fails (exit code 1) when a module goes over the budget or loads
+one of the deferred provider/backend packages:
+
+    python -m bench.import_profile
+    python -m bench.import_profile --budget-ms 300 --output import_profile.json
+"""
+import argparse, json, statistics, subprocess, sys
+from typing import Any, Dict, List, Tuple
+
+# Modules measured by default: the agent definitions and what they import
+DEFAULT_MODULES = ["app.agents.scrapper_agent", "core.builders.agent_builder", "core.executors.runnable_withmemory_executor"]
+
+# Packages that must only be imported on first use
+DEFERRED_PACKAGES = ["langchain_openai", "openai", "langchain_mongodb", "pymongo", "motor", "tiktoken", "aiohttp"]
+
+def profile(module: str) -> Tuple[float, List[Tuple[str, float]], List[str]]:
+    """
+    Imports a module in a fresh interpreter.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        Tuple[float, List[Tuple[str, float]], List[str]]: Total import time in ms, self time in ms of every
+            imported module, and the deferred packages that were loaded.
+    """
+    code = (f"import sys, json, {module}; "
+            f"print(json.dumps([name for name in {DEFERRED_PACKAGES!r} if name in sys.modules]))")
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if process.returncode != 0:
+        # An import that needs credentials or a server is a cold start problem on its own
+        error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "unknown error"
+        raise RuntimeError(f"Importing {module} failed: {error}")
+    modules, total = [], 0.0
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        modules.append((name, int(self_us) / 1000))
+        if name == module:
+            total = int(cumulative_us) / 1000
+    return total, modules, json.loads(process.stdout.strip().splitlines()[-1])
+
+def run(modules: List[str], repeat: int, budget_ms: float, top: int) -> Dict[str, Any]:
+    """
+    Profiles every module `repeat` times and checks the budget and the deferred packages.
+
+    Returns:
+        Dict[str, Any]: Per-module results and the overall status.
+    """
+    results = []
+    for module in modules:
+        try:
+            runs = [profile(module) for _ in range(repeat)]
+        except RuntimeError as e:
+            results.append({"module": module, "error": str(e), "ok": False})
+            continue
+        total = statistics.median(run[0] for run in runs)
+        slowest = sorted(runs[-1][1], key=lambda item: item[1], reverse=True)[:top]
+        loaded = runs[-1][2]
+        results.append({
+            "module": module,
+            "import_ms": total,
+            "runs_ms": [run[0] for run in runs],
+            "slowest": [{"module": name, "self_ms": self_ms} for name, self_ms in slowest],
+            "deferred_loaded": loaded,
+            "ok": total <= budget_ms and not loaded,
+        })
+    return {"python": sys.version.split()[0], "budget_ms": budget_ms, "results": results,
+            "ok": all(result["ok"] for result in results)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time profile of the entry modules")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=400.0, help="Maximum median import time per module")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imported modules to report")
+    parser.add_argument("--output", help="Write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.modules, args.repeat, args.budget_ms, args.top)
+    for result in report["results"]:
+        if "error" in result:
+            print(f"[IMPORT_PROFILE] {result['error']}", file=sys.stderr)
+            continue
+        status = "ok" if result["ok"] else "FAIL"
+        print(f"[IMPORT_PROFILE] {result['module']}: {result['import_ms']:.1f}ms "
+              f"(budget {args.budget_ms:.0f}ms) {status}"
+              + (f", loads {', '.join(result['deferred_loaded'])}" if result["deferred_loaded"] else ""),
+              file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    sys.exit(0 if report["ok"] else 1)
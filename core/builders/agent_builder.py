@@ -1,3 +1,5 @@
+import os
+from collections import OrderedDict
 from langchain_core.language_models import BaseChatModel
 from langchain_core.runnables import RunnableSerializable
 from langchain_core.language_models import BaseChatModel
@@ -6,18 +8,31 @@ from core.builders.prompt_builder import PromptBuilder
 from typing import List
 from core.executors.runnable_executor import RunnableExecutor
 from core.executors.runnable_withmemory_executor import RunnableWithMemoryExecutor
-from langchain_openai import ChatOpenAI
+from core.executors.tool_call_executor import ToolCallExecutor
+from core.executors.response_cache import CachedModel, ResponseCache
+from core.executors.request_scheduler import RequestScheduler, ScheduledModel
+from core.builders.model_pool import ModelPool
 
 class Agent:
     # A class to create an agent with a specific name, prompt, conversation history setting,
     # language model, and a list of tools.
 
+    # Runnables already created, keyed by the agent definition; the least recently used are dropped
+    # beyond AGENT_MAX_COMPILED entries
+    _compiled: "OrderedDict[tuple, RunnableSerializable]" = OrderedDict()
+    max_compiled: int = int(os.environ.get("AGENT_MAX_COMPILED", 128))
+
     def __init__(self, 
                  name: str, 
                  system_prompt: str,
                  conversation_history: bool,
                  llm: BaseChatModel,
-                 tools: List[str]) -> None:
+                 tools: List[str],
+                 execute_tools: bool = False,
+                 max_tool_iterations: int = 5,
+                 tool_timeout: float = 30.0,
+                 response_cache: ResponseCache = None,
+                 scheduler: RequestScheduler = None) -> None:
         """
         Initializes the Agent with the given parameters.
         
@@ -27,6 +42,14 @@ class Agent:
             conversation_history (bool): A flag indicating whether to include conversation history.
             llm (BaseChatModel): The language model used by the agent.
             tools (List[str]): A list of tool names to be used by the agent.
+            execute_tools (bool): Whether the agent runs the tool calls of the model and loops back to it
+                until it answers. Defaults to False, returning the tool calls to the caller.
+            max_tool_iterations (int): Maximum number of model calls per turn when executing tools. Defaults to 5.
+            tool_timeout (float): Timeout in seconds for each tool call. Defaults to 30.
+            response_cache (ResponseCache): Cache of the model answers, keyed on the rendered prompt, the model
+                and the bound tools. Defaults to None, calling the model every time.
+            scheduler (RequestScheduler): Rate limiter and priority scheduler of the model calls. Defaults to
+                the process-wide RequestScheduler.shared().
         """
         
         self.name: str = name
@@ -34,14 +57,52 @@ class Agent:
         self.conversation_history: bool = conversation_history
         self.llm: BaseChatModel = llm
         self.tools: List[str] = tools
+        self.execute_tools: bool = execute_tools
+        self.max_tool_iterations: int = max_tool_iterations
+        self.tool_timeout: float = tool_timeout
+        self.response_cache: ResponseCache = response_cache
+        self.scheduler: RequestScheduler = scheduler or RequestScheduler.shared()
+
+    def key(self) -> tuple:
+        """
+        Returns the key identifying the agent definition. The model is identified by its parameters, so
+        agents built from equal model instances share their entry; the cache and scheduler by instance.
+        """
+        return (self.name, self.system_prompt, self.conversation_history, self.model_key(self.llm), tuple(self.tools),
+                self.execute_tools, self.max_tool_iterations, self.tool_timeout, id(self.response_cache),
+                id(self.scheduler))
+
+    @staticmethod
+    def model_key(llm: BaseChatModel) -> str:
+        """
+        Returns the identity of a chat model: its type and parameters, or the instance when they cannot be read.
+
+        Args:
+            llm (BaseChatModel): The language model.
+
+        Returns:
+            str: The model identity.
+        """
+        if isinstance(llm, BaseChatModel):
+            try:
+                return llm._get_llm_string()
+            except Exception:
+                pass
+        return f"{type(llm).__name__}:{id(llm)}"
 
     def create(self) -> RunnableSerializable:
         """
-        Creates a runnable agent with the specified parameters.
+        Creates a runnable agent with the specified parameters. The runnable is built once per agent
+        definition; later calls return the same runnable.
         
         Returns:
             RunnableSerializable: The runnable agent with the specified prompt, model, and tools.
         """
+        key = self.key()
+        if key in Agent._compiled:
+            Agent._compiled.move_to_end(key)
+            return Agent._compiled[key]
+
         try:
             # Create the prompt using the PromptBuilder
             prompt = PromptBuilder.create(system_prompt=self.system_prompt, 
@@ -51,26 +112,65 @@ class Agent:
             tools_instances = ToolManager().get_tool(self.tools)
 
             # Create the runnable by combining the prompt, model, and tools
-            runnable = prompt | self.llm.bind_tools(tools_instances)
+            # Every provider call goes through the scheduler; cache hits are answered before it
+            # Providers reject an empty tools list, so models without tools are not bound
+            bound_model = self.llm.bind_tools(tools_instances) if tools_instances else self.llm
+            model = ScheduledModel(bound_model, self.scheduler).as_runnable()
+            if self.response_cache is not None:
+                model = CachedModel(model, self.response_cache, key_model=bound_model).as_runnable()
+            runnable = prompt | model
             runnable.name = self.name
 
+            # Run the requested tools concurrently inside the agent, so the history only stores the final answer
+            if self.execute_tools and tools_instances:
+                runnable = ToolCallExecutor(runnable,
+                                            tools_instances,
+                                            max_iterations=self.max_tool_iterations,
+                                            tool_timeout=self.tool_timeout).as_runnable()
+
+            Agent._compiled[key] = runnable
+            while len(Agent._compiled) > Agent.max_compiled:
+                Agent._compiled.popitem(last=False)
             return runnable
          
         except ValueError as e:
             # Print an error message if there is an issue creating the agent
             print(f"Error creating the agent {self.name}: {str(e)}")
 
-def define_agent(agent_name, agent_prompt, agent_history, agent_model, agent_tools) -> any:
+# Executors already defined, keyed by the define_agent arguments; the least recently used are dropped
+# beyond AGENT_MAX_COMPILED entries
+_defined_agents: "OrderedDict[tuple, RunnableExecutor]" = OrderedDict()
+
+# Both memos hold runnables bound to the pooled models, which ModelPool.aclose closes
+ModelPool.on_close(Agent._compiled.clear)
+ModelPool.on_close(_defined_agents.clear)
+
+def define_agent(agent_name, agent_prompt, agent_history, agent_model, agent_tools, agent_execute_tools=False,
+                 agent_response_cache=None) -> any:
+    # Reuse the executor of an identical agent definition
+    key = (agent_name, agent_prompt, agent_history, agent_model, tuple(agent_tools), agent_execute_tools,
+           id(agent_response_cache))
+    if key in _defined_agents:
+        _defined_agents.move_to_end(key)
+        return _defined_agents[key]
+
     # Create an instance of the Agent class with the specified parameters and create the agent
+    # The model comes from the ModelPool, sharing its HTTP connection pool with the other agents
     agent = Agent(
         name=agent_name,
         system_prompt=agent_prompt,
         conversation_history=agent_history,
-        llm=ChatOpenAI(model=agent_model),
-        tools=agent_tools
+        llm=ModelPool.get(agent_model),
+        tools=agent_tools,
+        execute_tools=agent_execute_tools,
+        response_cache=agent_response_cache
     ).create()
 
     if agent_history:
-        return RunnableWithMemoryExecutor(agent)
+        executor = RunnableWithMemoryExecutor(agent)
     else:
-        return RunnableExecutor(agent)
\ No newline at end of file
+        executor = RunnableExecutor(agent)
+    _defined_agents[key] = executor
+    while len(_defined_agents) > Agent.max_compiled:
+        _defined_agents.popitem(last=False)
+    return executor
\ No newline at end of file
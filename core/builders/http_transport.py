@@ -0,0 +1,53 @@
+import asyncio, threading, weakref
+import httpx
+
+class LoopBoundTransport(httpx.AsyncBaseTransport):
+    """
+    Async HTTP transport with one connection pool per event loop. Pooled connections belong to the loop that
+    opened them, so a client shared by several loops (e.g. one asyncio.run per call) must not hand the
+    kept-alive connections of a closed loop to the next one.
+
+    Attributes:
+        options (dict): Keyword arguments of the httpx.AsyncHTTPTransport of each loop.
+    """
+
+    def __init__(self, **options) -> None:
+        """
+        Initializes the transport. The pool of a loop is created on its first request.
+
+        Args:
+            **options: Keyword arguments for httpx.AsyncHTTPTransport, such as limits and http2.
+        """
+        self.options = options
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def transport(self) -> httpx.AsyncHTTPTransport:
+        """
+        Returns the transport of the running loop, dropping those of closed loops.
+
+        Returns:
+            httpx.AsyncHTTPTransport: The transport.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                for closed in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[closed]
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self.options)
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """
+        Closes the pool of the running loop. The pools of other loops cannot be closed from here and are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transports, self._transports = dict(self._transports), weakref.WeakKeyDictionary()
+        transport = transports.get(loop)
+        if transport is not None:
+            await transport.aclose()
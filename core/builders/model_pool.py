@@ -0,0 +1,125 @@
+import os, threading, importlib.util
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
+from langchain_core.language_models import BaseChatModel
+from loguru import logger
+
+# httpx and the provider SDKs are imported when the first model is built
+if TYPE_CHECKING:
+    import httpx
+
+class ModelPool:
+    # A process-wide pool of chat model clients. Models are built once per (provider, model, options) and
+    # every model of a provider shares one pooled HTTP transport, keeping connections alive across agents.
+    # The async connections are pooled per event loop, since they cannot outlive the loop that opened them.
+
+    _models: Dict[Tuple, BaseChatModel] = {}
+    _http_clients: Dict[str, Tuple["httpx.Client", "httpx.AsyncClient"]] = {}
+    _lock = threading.Lock()
+    # Called by aclose, so memoized agents do not keep using the closed models
+    _close_callbacks: List[Callable[[], None]] = []
+
+    @staticmethod
+    def http_options() -> dict:
+        """
+        Builds the HTTP pool options from the environment. HTTP/2 is used when the h2 package is installed,
+        unless LLM_HTTP2 is set to 0.
+
+        Returns:
+            dict: Keyword arguments for httpx clients.
+        """
+        import httpx
+        http2 = os.environ.get("LLM_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+        return {
+            "limits": httpx.Limits(
+                max_connections=int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", 100)),
+                max_keepalive_connections=int(os.environ.get("LLM_HTTP_MAX_KEEPALIVE", 20)),
+                keepalive_expiry=float(os.environ.get("LLM_HTTP_KEEPALIVE_EXPIRY", 30)),
+            ),
+            "http2": http2,
+        }
+
+    @classmethod
+    def http_clients(cls, provider: str) -> Tuple["httpx.Client", "httpx.AsyncClient"]:
+        """
+        Returns the shared sync and async HTTP clients of a provider, creating them on first use. The async
+        client keeps one connection pool per event loop.
+
+        Args:
+            provider (str): The provider name.
+
+        Returns:
+            Tuple[httpx.Client, httpx.AsyncClient]: The pooled clients.
+        """
+        clients = cls._http_clients.get(provider)
+        if clients is None:
+            with cls._lock:
+                clients = cls._http_clients.get(provider)
+                if clients is None:
+                    import httpx
+                    from core.builders.http_transport import LoopBoundTransport
+                    options = cls.http_options()
+                    clients = (httpx.Client(**options), httpx.AsyncClient(transport=LoopBoundTransport(**options)))
+                    cls._http_clients[provider] = clients
+                    logger.debug(f"[MODEL_POOL] HTTP clients created for {provider} (http2={options['http2']}).")
+        return clients
+
+    @classmethod
+    def get(cls, model: str, provider: str = "openai", **model_kwargs) -> BaseChatModel:
+        """
+        Returns the shared chat model for the provider, model name and options.
+
+        Args:
+            model (str): The model name.
+            provider (str, optional): The provider name. Only "openai" is supported. Default is "openai".
+            **model_kwargs: Extra options for the chat model, part of the pool key. stream_usage defaults
+                to True, so streamed answers report the usage the RequestScheduler settles its budgets with.
+
+        Returns:
+            BaseChatModel: The pooled chat model.
+        """
+        model_kwargs.setdefault("stream_usage", True)
+        key = (provider, model, tuple(sorted(model_kwargs.items())))
+        chat_model = cls._models.get(key)
+        if chat_model is not None:
+            return chat_model
+
+        if provider != "openai":
+            raise ValueError(f"Unsupported model provider: {provider}")
+        http_client, http_async_client = cls.http_clients(provider)
+        with cls._lock:
+            chat_model = cls._models.get(key)
+            if chat_model is None:
+                # The provider SDK is imported with the first model, not with this module
+                from langchain_openai import ChatOpenAI
+                chat_model = ChatOpenAI(model=model,
+                                        http_client=http_client,
+                                        http_async_client=http_async_client,
+                                        **model_kwargs)
+                cls._models[key] = chat_model
+        return chat_model
+
+    @classmethod
+    def on_close(cls, callback: Callable[[], None]) -> None:
+        """
+        Registers a callback run by aclose, to drop the objects memoized on top of the pooled models.
+
+        Args:
+            callback (Callable[[], None]): The callback, e.g. the clear method of a memo.
+        """
+        cls._close_callbacks.append(callback)
+
+    @classmethod
+    async def aclose(cls) -> None:
+        """
+        Closes the shared HTTP clients and drops the pooled models and the memos registered with on_close.
+        The async connections are closed on the running loop.
+        """
+        with cls._lock:
+            clients = list(cls._http_clients.values())
+            cls._http_clients.clear()
+            cls._models.clear()
+        for callback in cls._close_callbacks:
+            callback()
+        for client, async_client in clients:
+            client.close()
+            await async_client.aclose()
@@ -0,0 +1,223 @@
+import asyncio, functools, inspect, json, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple, Type
+from langchain_core.tools import BaseTool
+from loguru import logger
+from core.utils.metrics import MetricsRegistry
+
+# Metadata flag that skips the cache, e.g. tool.invoke(args, config={"metadata": {BYPASS_TOOL_CACHE: True}})
+BYPASS_TOOL_CACHE = "bypass_tool_cache"
+
+class ToolResultCache:
+    # An LRU cache of tool results with TTL and single-flight deduplication of concurrent identical calls.
+
+    def __init__(self, ttl: Optional[float] = 300.0, max_entries: int = 1024) -> None:
+        """
+        Initializes the ToolResultCache.
+
+        Args:
+            ttl (Optional[float]): Seconds a result stays valid. None never expires. Default is 300.
+            max_entries (int): Maximum number of cached results. Default is 1024.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._sync_in_flight: Dict[str, Future] = {}
+        self._async_in_flight: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        MetricsRegistry.shared().register("tool_cache", self.stats)
+
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        """
+        Looks the key up. Must be called with the lock held.
+        """
+        entry = self._entries.get(key)
+        if entry is None or (self.ttl is not None and time.time() - entry[1] > self.ttl):
+            self._entries.pop(key, None)
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[0]
+
+    def _store(self, key: str, value: Any) -> None:
+        # Errors are never cached
+        if isinstance(value, BaseException):
+            return
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def run(self, key: str, func) -> Any:
+        """
+        Returns the cached result of the key, or runs func once for all the concurrent callers of the key.
+
+        Args:
+            key (str): The cache key.
+            func (Callable[[], Any]): Computes the result.
+
+        Returns:
+            Any: The result.
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            future = self._sync_in_flight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._sync_in_flight[key] = Future()
+            else:
+                self.shared += 1
+
+        if not owner:
+            return future.result()
+        try:
+            value = func()
+            self._store(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._sync_in_flight.pop(key, None)
+
+    async def arun(self, key: str, afunc) -> Any:
+        """
+        Async version of run. Concurrent identical calls on the same event loop share one execution. If the
+        caller running it is cancelled, the next waiting caller runs afunc instead.
+
+        Args:
+            key (str): The cache key.
+            afunc (Callable[[], Awaitable[Any]]): Computes the result.
+
+        Returns:
+            Any: The result.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (key, id(loop))
+        while True:
+            with self._lock:
+                found, value = self._lookup(key)
+                if found:
+                    self.hits += 1
+                    return value
+                future = self._async_in_flight.get(flight_key)
+                owner = future is None
+                if owner:
+                    self.misses += 1
+                    future = self._async_in_flight[flight_key] = loop.create_future()
+                else:
+                    self.shared += 1
+
+            if owner:
+                return await self.__run_owner(key, flight_key, future, afunc)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The owner was cancelled, not this caller: take over the execution
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+
+    async def __run_owner(self, key: str, flight_key: Tuple[str, int], future: asyncio.Future, afunc) -> Any:
+        """
+        Runs afunc for the callers waiting on the future.
+        """
+        try:
+            value = await afunc()
+            self._store(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # Hands the execution over: the in-flight entry is dropped and the waiters retry
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no other caller was waiting
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._async_in_flight.pop(flight_key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the cache counters.
+
+        Returns:
+            Dict[str, float]: Hits, misses, calls that shared an in-flight execution, and hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses + self.shared
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "hit_rate": (self.hits + self.shared) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+def cacheable(ttl: Optional[float] = 300.0, max_entries: int = 1024):
+    """
+    Class decorator that memoizes the results of a deterministic BaseTool subclass.
+
+    The key is the tool name plus the input validated by args_schema. Results are kept for ttl seconds,
+    concurrent identical calls share one execution, and a call skips the cache when its config metadata
+    sets BYPASS_TOOL_CACHE. The cache is exposed as the result_cache class attribute.
+
+    Args:
+        ttl (Optional[float]): Seconds a result stays valid. None never expires. Default is 300.
+        max_entries (int): Maximum number of cached results. Default is 1024.
+
+    Returns:
+        Callable[[Type[BaseTool]], Type[BaseTool]]: The decorator.
+    """
+    def decorate(cls: Type[BaseTool]) -> Type[BaseTool]:
+        cache = ToolResultCache(ttl=ttl, max_entries=max_entries)
+        run, arun = cls._run, cls._arun
+        run_accepts_manager = "run_manager" in inspect.signature(run).parameters
+        arun_accepts_manager = "run_manager" in inspect.signature(arun).parameters
+
+        def key_of(tool: BaseTool, args: tuple, kwargs: dict) -> str:
+            return json.dumps([tool.name, args, kwargs], sort_keys=True, default=str)
+
+        def bypass(run_manager) -> bool:
+            return bool(run_manager is not None and (getattr(run_manager, "metadata", None) or {}).get(BYPASS_TOOL_CACHE))
+
+        @functools.wraps(run)
+        def _run(self, *args, run_manager=None, **kwargs):
+            call = lambda: run(self, *args, **({"run_manager": run_manager} if run_accepts_manager else {}), **kwargs)
+            if bypass(run_manager):
+                return call()
+            return cache.run(key_of(self, args, kwargs), call)
+
+        @functools.wraps(arun)
+        async def _arun(self, *args, run_manager=None, **kwargs):
+            call = lambda: arun(self, *args, **({"run_manager": run_manager} if arun_accepts_manager else {}), **kwargs)
+            if bypass(run_manager):
+                return await call()
+            return await cache.arun(key_of(self, args, kwargs), call)
+
+        cls._run = _run
+        # Tools without their own _arun run the cached _run in a thread through BaseTool._arun
+        if arun is not BaseTool._arun:
+            cls._arun = _arun
+        cls.result_cache = cache
+        logger.debug(f"[TOOL_CACHE] {cls.__name__} results are cached (ttl={ttl}, max_entries={max_entries}).")
+        return cls
+
+    return decorate
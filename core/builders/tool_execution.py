@@ -0,0 +1,53 @@
+import functools
+from typing import Optional, Type
+from langchain_core.tools import BaseTool
+from loguru import logger
+from core.executors.tool_process_pool import ToolProcessPool
+
+# Execution modes a tool can declare: on the event loop, in the thread pool of the executor, or in a worker process
+EXECUTION_MODES = ("inline", "thread", "process")
+
+def execution_mode(mode: str, timeout: Optional[float] = None):
+    """
+    Class decorator that declares how ToolCallExecutor runs a BaseTool subclass.
+
+    "inline" tools run on the event loop (their _arun, or _run for synchronous tools), so they must be quick.
+    "thread" tools run their _run in the thread pool of the executor, for blocking I/O. "process" tools are
+    CPU-bound: their _run runs in the shared ToolProcessPool, outside the GIL, so the tool instance, its
+    inputs and its output must be picklable. Tools without the decorator run inline when they implement
+    _arun and in a thread otherwise. Put @cacheable above this decorator, so cache hits do not reach the pool.
+
+    Args:
+        mode (str): One of "inline", "thread" or "process".
+        timeout (Optional[float]): Seconds before a process call is abandoned and its worker killed. Default is None,
+            which leaves the timeout to the executor.
+
+    Returns:
+        Callable[[Type[BaseTool]], Type[BaseTool]]: The decorator.
+    """
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode {mode!r}, expected one of {EXECUTION_MODES}")
+
+    def decorate(cls: Type[BaseTool]) -> Type[BaseTool]:
+        cls.execution_mode = mode
+        if mode != "process":
+            return cls
+        run = cls._run
+
+        # The run manager holds callbacks bound to this process, so it is not sent to the worker
+        @functools.wraps(run)
+        def _run(self, *args, run_manager=None, **kwargs):
+            return ToolProcessPool.shared().run(self, args, kwargs, timeout=timeout)
+
+        @functools.wraps(run)
+        async def _arun(self, *args, run_manager=None, **kwargs):
+            return await ToolProcessPool.shared().arun(self, args, kwargs, timeout=timeout)
+
+        # Workers call the original _run, found on the class after unpickling the tool
+        cls._process_run = run
+        cls._run, cls._arun = _run, _arun
+        ToolProcessPool.tool_modules.add(cls.__module__)
+        logger.debug(f"[TOOL_EXECUTION] {cls.__name__} runs in the tool process pool (timeout={timeout}).")
+        return cls
+
+    return decorate
@@ -1,30 +1,159 @@
-import importlib, inspect, sys, glob, os
+import importlib, importlib.util, inspect, sys, glob, os, json, threading
 from langchain_core.tools import Tool
-from typing import List, Type
-from dotenv import load_dotenv
+from typing import Dict, List, Optional, Type
 from pathlib import Path
 from langchain_core.tools import BaseTool
 from loguru import logger
 
-# Load environment variables from a .env file
-load_dotenv()
+# Package of the tool modules, relative to the project root
+TOOLS_PACKAGE = "app.agents.tools"
+
+class ToolRegistry:
+    # A process-wide registry that discovers the tool classes once, maps their names to classes
+    # and only builds the tools that are actually requested.
+
+    _classes: Optional[Dict[str, str]] = None
+    _instances: Dict[str, BaseTool] = {}
+    _lock = threading.RLock()
+
+    @classmethod
+    def tool_specs(cls) -> Dict[str, str]:
+        """
+        Returns the discovered tools, loaded from the manifest in TOOL_MANIFEST if set, otherwise
+        by scanning the tools folder. Discovery only happens once per process.
+
+        Returns:
+            Dict[str, str]: Tool names mapped to "module:ClassName" specs.
+        """
+        if cls._classes is None:
+            with cls._lock:
+                if cls._classes is None:
+                    manifest = os.environ.get("TOOL_MANIFEST")
+                    cls._classes = cls.__load_manifest(manifest) if manifest else cls.__scan()
+                    logger.debug(f"[TOOL_MANAGER] {len(cls._classes)} tools discovered.")
+        return cls._classes
+
+    @classmethod
+    def get(cls, name: str) -> Optional[BaseTool]:
+        """
+        Returns the instance of a tool, importing and building it on first use.
+
+        Args:
+            name (str): The tool name.
+
+        Returns:
+            Optional[BaseTool]: The tool instance, or None if there is no tool with that name.
+        """
+        instance = cls._instances.get(name)
+        if instance is not None:
+            return instance
+
+        spec = cls.tool_specs().get(name)
+        if spec is None:
+            return None
+        with cls._lock:
+            if name not in cls._instances:
+                cls._instances[name] = cls.__load_class(spec)()
+                logger.debug(f"[TOOL_MANAGER] Tool {name} initialized.")
+        return cls._instances[name]
+
+    @classmethod
+    def write_manifest(cls, path: str) -> None:
+        """
+        Writes the discovered tools to a JSON manifest, to be used through TOOL_MANIFEST.
+
+        Args:
+            path (str): Path of the manifest file.
+        """
+        with open(path, "w") as f:
+            json.dump(cls.tool_specs(), f, indent=4)
+
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Forgets the discovered tools and built instances, so the next call discovers them again.
+        """
+        with cls._lock:
+            cls._classes = None
+            cls._instances = {}
+
+    @staticmethod
+    def __load_manifest(path: str) -> Dict[str, str]:
+        with open(path) as f:
+            return json.load(f)
+
+    @classmethod
+    def __scan(cls) -> Dict[str, str]:
+        """
+        Scans the tools folder and maps every BaseTool subclass by its name.
+
+        Returns:
+            Dict[str, str]: Tool names mapped to "module:ClassName" specs.
+        """
+        specs = {}
+        path = os.path.abspath(os.curdir)
+        for file in glob.glob(f"{path}/app/agents/tools/*.py"):
+            tool_module = cls.__import(f"{TOOLS_PACKAGE}.{Path(file).stem}", file)
+            for name_local, ToolClass in inspect.getmembers(tool_module, inspect.isclass):
+                if (issubclass(ToolClass, BaseTool)
+                    and ToolClass is not BaseTool
+                    and ToolClass.__module__ == tool_module.__name__):
+                        specs[cls.__tool_name(ToolClass)] = f"{tool_module.__name__}:{name_local}"
+        return specs
+
+    @staticmethod
+    def __tool_name(ToolClass: Type[BaseTool]) -> str:
+        """
+        Reads the tool name from the class field default, building the tool only if there is none.
+        """
+        fields = getattr(ToolClass, "model_fields", None) or getattr(ToolClass, "__fields__", {})
+        field = fields.get("name")
+        default = getattr(field, "default", None)
+        return default if isinstance(default, str) else ToolClass().name
+
+    @classmethod
+    def __load_class(cls, spec: str) -> Type[BaseTool]:
+        module_name, class_name = spec.split(":")
+        file = os.path.join(os.path.abspath(os.curdir), *module_name.split(".")) + ".py"
+        return getattr(cls.__import(module_name, file), class_name)
+
+    @staticmethod
+    def __import(module_name: str, file: str):
+        """
+        Imports a tool module from its file once, without touching sys.path.
+        """
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        spec = importlib.util.spec_from_file_location(module_name, file)
+        if spec is None:
+            return importlib.import_module(module_name)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        return module
 
 class ToolManager:
     # A class to manage and retrieve tools
 
     def __init__(self) -> None:
         """
-        Initializes the ToolManager with a dictionary of mapped tools.
+        Initializes the ToolManager on top of the process-wide ToolRegistry.
         """
+        logger.debug(f"[TOOL_MANAGER] {len(ToolRegistry.tool_specs())} tools available.")
 
-        self.instances = get_tool_instances()
-
-        mapped_tools = {}
-        for instance in self.instances:
-            mapped_tools[instance.name] = instance
+    @property
+    def MAPPED_TOOLS(self) -> Dict[str, BaseTool]:
+        """
+        Returns all the tool instances mapped by name. Builds every tool.
+        """
+        return {name: ToolRegistry.get(name) for name in ToolRegistry.tool_specs()}
 
-        logger.debug(f"[TOOL_MANAGER] {len(mapped_tools)} tools initialized.")
-        self.MAPPED_TOOLS = mapped_tools
+    @property
+    def instances(self) -> List[Type[Tool]]:
+        """
+        Returns all the tool instances. Builds every tool.
+        """
+        return list(self.MAPPED_TOOLS.values())
 
     @staticmethod
     def all() -> List[Type[Tool]]:
@@ -38,7 +167,7 @@ class ToolManager:
 
     def get_tool(self, tools: list) -> List[Type[Tool]]:
         """
-        Retrieves the tool instances based on the provided tool names.
+        Retrieves the tool instances based on the provided tool names. Only these tools are built.
         
         Args:
             tools (list): A list of tool names to retrieve.
@@ -46,21 +175,7 @@ class ToolManager:
         Returns:
             List[Type[Tool]]: A list of tool instances corresponding to the provided tool names.
         """
-        return [self.MAPPED_TOOLS[tool] for tool in tools if tool in self.MAPPED_TOOLS]
+        return [instance for instance in map(ToolRegistry.get, tools) if instance is not None]
 
 def get_tool_instances() -> List[Type[Tool]]:
-    instances = []
-    path = os.path.abspath(os.curdir)
-    for file in glob.glob(f"{path}/app/agents/tools/*.py"):
-        p,f = os.path.split(file)
-        path_pyfile = Path(file)
-        sys.path.append(str(path_pyfile.parent))
-        tool_module = importlib.import_module(path_pyfile.stem)
-        for name_local in dir(tool_module):
-            if (not name_local.endswith("py") 
-                and inspect.isclass(getattr(tool_module, name_local))
-                and issubclass(getattr(tool_module, name_local), BaseTool) 
-                and name_local not in ['BaseTool']):
-                    ToolClass = getattr(tool_module, name_local)
-                    instances.append(ToolClass())
-    return instances
+    return [ToolRegistry.get(name) for name in ToolRegistry.tool_specs()]
@@ -0,0 +1,413 @@
+import asyncio, contextlib, copy, inspect, time
+from typing import Annotated, Any, Callable, Dict, List, Optional, Sequence, Set, Union, get_type_hints
+from langchain_core.load import dumpd, load
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from loguru import logger
+from core.executors.runnable_executor import RAISE_ON_FAILURE, AgentState
+
+# Virtual entry and exit nodes of a graph
+START = "__start__"
+END = "__end__"
+
+def add_messages(left: Optional[List[BaseMessage]], right: Union[BaseMessage, List[BaseMessage]]) -> List[BaseMessage]:
+    """
+    Reducer appending the messages of a node to the conversation. Nodes built on RunnableExecutor
+    return a single message.
+
+    Args:
+        left (Optional[List[BaseMessage]]): The current messages.
+        right (Union[BaseMessage, List[BaseMessage]]): The messages returned by the node.
+
+    Returns:
+        List[BaseMessage]: The merged messages.
+    """
+    return list(left or []) + (list(right) if isinstance(right, (list, tuple)) else [right])
+
+class GraphState(AgentState, total=False):
+    """
+    State shared by the nodes of an AgentGraph: AgentState plus the conversation messages, merged with
+    add_messages so concurrent branches append instead of overwriting each other.
+
+    Attributes:
+        messages (Annotated[list[BaseMessage], add_messages]): Messages of the conversation.
+    """
+    messages: Annotated[list[BaseMessage], add_messages]
+
+class GraphError(RuntimeError):
+    # Raised when a graph run fails; the checkpoint keeps the finished nodes for the next attempt
+
+    def __init__(self, message: str, node: Optional[str] = None, run_id: Optional[str] = None):
+        super().__init__(message)
+        self.node = node
+        self.run_id = run_id
+
+class Checkpointer:
+    """
+    Base class of the checkpoint stores. A checkpoint holds the merged state, the nodes triggered but not
+    finished and the partial joins of a run, saved after every finished node.
+    Subclasses implement get, put and delete; stores doing blocking I/O also override the async variants,
+    which AgentGraph awaits.
+    """
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, run_id: str, checkpoint: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, run_id: str) -> None:
+        raise NotImplementedError
+
+    async def aget(self, run_id: str) -> Optional[Dict[str, Any]]:
+        return self.get(run_id)
+
+    async def aput(self, run_id: str, checkpoint: Dict[str, Any]) -> None:
+        self.put(run_id, checkpoint)
+
+    async def adelete(self, run_id: str) -> None:
+        self.delete(run_id)
+
+class InMemoryCheckpointer(Checkpointer):
+    # Checkpoints kept in the process memory, enough to resume a run after a failed node
+
+    def __init__(self):
+        self._checkpoints: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        checkpoint = self._checkpoints.get(run_id)
+        return copy.deepcopy(checkpoint) if checkpoint is not None else None
+
+    def put(self, run_id: str, checkpoint: Dict[str, Any]) -> None:
+        self._checkpoints[run_id] = copy.deepcopy(checkpoint)
+
+    def delete(self, run_id: str) -> None:
+        self._checkpoints.pop(run_id, None)
+
+class MongoCheckpointer(Checkpointer):
+    # Checkpoints stored in MongoDB, so a run can be resumed by another process.
+    # The async variants run the pymongo calls in a thread, off the event loop running the graph.
+
+    def __init__(self,
+                 client=None,
+                 connection_string: Optional[str] = None,
+                 database_name: str = "chat_history",
+                 collection_name: str = "graph_checkpoints"):
+        """
+        Initializes the MongoCheckpointer.
+
+        Args:
+            client (MongoClient, optional): Client to use. Default is the pooled client of MongoClientPool.
+            connection_string (str, optional): Connection string of the pooled client. Default is MONGODB_CONN_STRING.
+            database_name (str, optional): Database name. Default is chat_history.
+            collection_name (str, optional): Collection name. Default is graph_checkpoints.
+        """
+        from core.memory.mongo_client_pool import MongoClientPool
+        client = client or MongoClientPool.get_client(connection_string)
+        self.collection = client[database_name][collection_name]
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        document = self.collection.find_one({"_id": run_id})
+        return load(document["checkpoint"]) if document else None
+
+    def put(self, run_id: str, checkpoint: Dict[str, Any]) -> None:
+        self.collection.replace_one({"_id": run_id}, self.__document(run_id, checkpoint), upsert=True)
+
+    def delete(self, run_id: str) -> None:
+        self.collection.delete_one({"_id": run_id})
+
+    async def aget(self, run_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, run_id)
+
+    async def aput(self, run_id: str, checkpoint: Dict[str, Any]) -> None:
+        # Serialized on the loop, since the running nodes may change the state meanwhile
+        document = self.__document(run_id, checkpoint)
+        await asyncio.to_thread(self.collection.replace_one, {"_id": run_id}, document, upsert=True)
+
+    async def adelete(self, run_id: str) -> None:
+        await asyncio.to_thread(self.delete, run_id)
+
+    @staticmethod
+    def __document(run_id: str, checkpoint: Dict[str, Any]) -> Dict[str, Any]:
+        return {"_id": run_id, "checkpoint": dumpd(checkpoint), "updated": time.time()}
+
+class AgentGraph:
+    """
+    Runs agents and functions as the nodes of a graph. Nodes are RunnableExecutors (e.g. from define_agent)
+    or callables taking (state, config) and returning a partial state. Nodes start as soon as they are
+    triggered, so independent branches run concurrently on the event loop; their results are merged with
+    the reducers declared in the state schema (e.g. operator.add on intermediate_steps).
+
+    Edges:
+        add_edge("a", "b"): b runs after a.
+        add_edge(["a", "b"], "c"): c runs once both a and b have finished.
+        add_conditional_edges("a", condition, path_map): after a, condition(state) picks the next node(s).
+
+    With a checkpointer and a run_id, the state is saved after every finished node; running the same run_id
+    again after a failure resumes from the failed node without running the finished branches again.
+
+    Attributes:
+        state_schema (type): TypedDict of the state, whose Annotated fields declare the reducers.
+        checkpointer (Optional[Checkpointer]): Store of the checkpoints.
+        max_steps (int): Maximum number of node runs per graph run, guarding against endless cycles.
+        max_concurrency (Optional[int]): Maximum number of nodes running at the same time.
+    """
+
+    def __init__(self,
+                 state_schema: type = GraphState,
+                 checkpointer: Checkpointer = None,
+                 max_steps: int = 25,
+                 max_concurrency: int = None):
+        """
+        Initializes an empty AgentGraph.
+
+        Args:
+            state_schema (type, optional): TypedDict of the state. Default is GraphState.
+            checkpointer (Checkpointer, optional): Store of the checkpoints. Default disables checkpointing.
+            max_steps (int, optional): Maximum number of node runs per graph run. Default is 25.
+            max_concurrency (int, optional): Maximum number of nodes running at the same time. Default is unbounded.
+        """
+        self.state_schema = state_schema
+        self.checkpointer = checkpointer
+        self.max_steps = max_steps
+        self.max_concurrency = max_concurrency
+        self.nodes: Dict[str, Callable] = {}
+        self.edges: Dict[str, List[str]] = {}
+        self.joins: List[tuple] = []
+        self.branches: Dict[str, tuple] = {}
+        self.reducers: Dict[str, Callable] = {
+            key: hint.__metadata__[-1]
+            for key, hint in get_type_hints(state_schema, include_extras=True).items()
+            if getattr(hint, "__metadata__", None) and callable(hint.__metadata__[-1])
+        }
+
+    def add_node(self, name: str, node: Callable) -> "AgentGraph":
+        """
+        Adds a node.
+
+        Args:
+            name (str): The node name.
+            node (Callable): A RunnableExecutor or a callable (state, config) -> partial state, sync or async.
+                Sync callables run in a worker thread.
+
+        Returns:
+            AgentGraph: The graph, for chaining.
+        """
+        if name in (START, END) or name in self.nodes:
+            raise ValueError(f"Node {name} already exists or is reserved")
+        self.nodes[name] = node
+        return self
+
+    def add_edge(self, source: Union[str, Sequence[str]], target: str) -> "AgentGraph":
+        """
+        Adds an edge. With several sources, the target waits for all of them.
+
+        Args:
+            source (Union[str, Sequence[str]]): The source node, START, or a list of nodes to join.
+            target (str): The target node or END.
+
+        Returns:
+            AgentGraph: The graph, for chaining.
+        """
+        if isinstance(source, str):
+            self.edges.setdefault(source, []).append(target)
+        else:
+            self.joins.append((frozenset(source), target))
+        return self
+
+    def add_conditional_edges(self,
+                              source: str,
+                              condition: Callable[[Dict[str, Any]], Union[str, List[str]]],
+                              path_map: Optional[Dict[Any, str]] = None) -> "AgentGraph":
+        """
+        Adds a conditional edge: after source, condition picks the next node, several nodes to run in
+        parallel, or END.
+
+        Args:
+            source (str): The source node.
+            condition (Callable): Function of the merged state returning a node name, a list of them or a key
+                of path_map.
+            path_map (Dict[Any, str], optional): Maps the values returned by condition to node names or lists
+                of node names.
+
+        Returns:
+            AgentGraph: The graph, for chaining.
+        """
+        self.branches[source] = (condition, path_map)
+        return self
+
+    def validate(self) -> None:
+        """
+        Checks that the graph has an entry point and every edge points to an existing node.
+
+        Raises:
+            ValueError: If the graph is malformed.
+        """
+        if not self.edges.get(START):
+            raise ValueError("Graph has no edge from START")
+        known = set(self.nodes) | {START, END}
+        targets = [target for targets in self.edges.values() for target in targets]
+        targets += [target for _, target in self.joins]
+        sources = list(self.edges) + list(self.branches) + [source for sources, _ in self.joins for source in sources]
+        for name in targets + sources:
+            if name not in known:
+                raise ValueError(f"Edge refers to unknown node {name}")
+        for _, path_map in self.branches.values():
+            for target in (path_map or {}).values():
+                for name in (target if isinstance(target, (list, tuple)) else [target]):
+                    if name not in known:
+                        raise ValueError(f"Conditional edge refers to unknown node {name}")
+
+    def merge(self, state: Dict[str, Any], update: Optional[Dict[str, Any]]) -> None:
+        """
+        Merges the partial state returned by a node, in place, using the reducers of the schema.
+
+        Args:
+            state (Dict[str, Any]): The graph state.
+            update (Optional[Dict[str, Any]]): The partial state returned by the node.
+        """
+        for key, value in (update or {}).items():
+            reducer = self.reducers.get(key)
+            if reducer is None:
+                state[key] = value
+            else:
+                state[key] = reducer(state[key] if key in state else [], value)
+
+    def next_nodes(self, node: str, state: Dict[str, Any], arrived: Dict[int, Set[str]]) -> List[str]:
+        """
+        Returns the nodes triggered by a finished node: its edges, its conditional edge evaluated on the
+        merged state and the joins it completes.
+
+        Args:
+            node (str): The finished node.
+            state (Dict[str, Any]): The merged state.
+            arrived (Dict[int, Set[str]]): Finished sources of each join, updated in place.
+
+        Returns:
+            List[str]: The triggered nodes, END excluded.
+        """
+        targets = list(self.edges.get(node, []))
+        if node in self.branches:
+            condition, path_map = self.branches[node]
+            chosen = condition(state)
+            for choice in (chosen if isinstance(chosen, (list, tuple, set)) else [chosen]):
+                target = path_map[choice] if path_map else choice
+                targets.extend(target if isinstance(target, (list, tuple)) else [target])
+        for index, (sources, target) in enumerate(self.joins):
+            if node in sources:
+                arrived.setdefault(index, set()).add(node)
+                if arrived[index] == sources:
+                    arrived[index] = set()
+                    targets.append(target)
+        return [target for target in targets if target != END]
+
+    async def __run_node(self, name: str, state: Dict[str, Any], config: RunnableConfig, semaphore) -> Optional[Dict[str, Any]]:
+        """
+        Runs a node on a copy of the state, so concurrent branches do not see each other's changes.
+        """
+        node = self.nodes[name]
+        node_state = {key: list(value) if isinstance(value, list) else value for key, value in state.items()}
+        # Executors raise their final error instead of answering with it, so the failed node stays pending
+        node_config = {**(config or {}), "metadata": {**(config or {}).get("metadata", {}), "graph_node": name,
+                                                      RAISE_ON_FAILURE: True}}
+        async with semaphore:
+            start = time.monotonic()
+            if inspect.iscoroutinefunction(node) or inspect.iscoroutinefunction(getattr(node, "__call__", None)):
+                update = await node(node_state, node_config)
+            else:
+                update = await asyncio.to_thread(node, node_state, node_config)
+            logger.debug(f"[GRAPH] Node {name} finished in {time.monotonic() - start:.2f}s.")
+        return update
+
+    async def ainvoke(self, state: Dict[str, Any], config: RunnableConfig = None, run_id: str = None) -> Dict[str, Any]:
+        """
+        Runs the graph until no node is left to run.
+
+        Args:
+            state (Dict[str, Any]): The initial state. Ignored when resuming an unfinished run_id.
+            config (RunnableConfig, optional): Configuration passed to every node, e.g. the session id.
+            run_id (str, optional): Identifier of the run, enabling checkpoints when a checkpointer is set.
+
+        Returns:
+            Dict[str, Any]: The final merged state.
+
+        Raises:
+            GraphError: If a node fails or max_steps is exceeded. Finished nodes stay checkpointed.
+        """
+        self.validate()
+        checkpointing = self.checkpointer is not None and run_id is not None
+        checkpoint = await self.checkpointer.aget(run_id) if checkpointing else None
+
+        if checkpoint and checkpoint["status"] != "done":
+            state, steps = checkpoint["state"], checkpoint["steps"]
+            pending = list(checkpoint["pending"])
+            arrived = {int(index): set(sources) for index, sources in checkpoint["arrived"].items()}
+            logger.info(f"[GRAPH] Resuming run {run_id} at {pending} after {steps} steps.")
+        else:
+            state, steps, arrived = dict(state), 0, {}
+            pending = self.next_nodes(START, state, arrived)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency else contextlib.nullcontext()
+        running: Dict[asyncio.Task, str] = {}
+        failure = None
+
+        async def save(status: str) -> None:
+            if checkpointing:
+                await self.checkpointer.aput(run_id, {
+                    "status": status,
+                    "state": state,
+                    "steps": steps,
+                    # Nodes still running have not finished, so they run again on resume
+                    "pending": list(running.values()) + pending,
+                    "arrived": {str(index): sorted(sources) for index, sources in arrived.items()},
+                })
+
+        try:
+            while pending or running:
+                # Start every triggered node right away, a node already running is started again once it ends
+                for name in list(pending):
+                    if failure is None and name not in running.values():
+                        if steps >= self.max_steps:
+                            failure = GraphError(f"Graph exceeded {self.max_steps} steps", node=name, run_id=run_id)
+                            break
+                        pending.remove(name)
+                        steps += 1
+                        running[asyncio.create_task(self.__run_node(name, state, config, semaphore))] = name
+                if not running:
+                    break
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    try:
+                        update = task.result()
+                    except Exception as e:
+                        logger.warning(f"[GRAPH] Node {name} failed: {e!r}")
+                        # Keep the failed node pending and let the other branches finish and checkpoint
+                        pending.insert(0, name)
+                        steps -= 1
+                        failure = failure or GraphError(f"Node {name} failed: {e!r}", node=name, run_id=run_id)
+                        failure.__cause__ = failure.__cause__ or e
+                        continue
+                    self.merge(state, update)
+                    pending.extend(self.next_nodes(name, state, arrived))
+                    await save("running")
+                if failure is not None and not running:
+                    break
+        except BaseException:
+            for task in running:
+                task.cancel()
+            await save("failed")
+            raise
+
+        if failure is not None:
+            await save("failed")
+            raise failure
+        await save("done")
+        return state
+
+    def invoke(self, state: Dict[str, Any], config: RunnableConfig = None, run_id: str = None) -> Dict[str, Any]:
+        """
+        Synchronous variant of ainvoke, for callers without an event loop.
+        """
+        return asyncio.run(self.ainvoke(state, config=config, run_id=run_id))
@@ -0,0 +1,111 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+from langchain_core.runnables import Runnable, RunnableConfig
+from loguru import logger
+from core.utils.metrics import MetricsRegistry
+
+class MicroBatcher:
+    """
+    Coalesces concurrent invocations of a Runnable into abatch calls. Requests are collected for up to
+    max_wait seconds or until max_batch_size are waiting, dispatched together and each waiter gets its own
+    result. Every request keeps its own config, so per-session history reads and writes still apply.
+
+    This only helps Runnables that implement abatch natively. The default abatch, used by the agent
+    runnables (RunnableWithMessageHistory and the RunnableLambda wrappers of the model), runs the inputs
+    with concurrent ainvoke calls, so a batch still makes one model request per input.
+
+    Attributes:
+        runnable (Runnable): The Runnable to batch.
+        max_batch_size (int): Maximum number of requests per batch.
+        max_wait (float): Seconds the first request of a batch waits for others.
+    """
+
+    def __init__(self, runnable: Runnable, max_batch_size: int = 16, max_wait: float = 0.005):
+        """
+        Initializes the MicroBatcher.
+
+        Args:
+            runnable (Runnable): The Runnable to batch.
+            max_batch_size (int, optional): Maximum number of requests per batch. Default is 16.
+            max_wait (float, optional): Seconds the first request of a batch waits for others. Default is 0.005.
+        """
+        self.runnable = runnable
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[Any, RunnableConfig, asyncio.Future]] = []
+        self._timer = None
+        self._dispatching: set = set()
+        self.batches = 0
+        self.requests = 0
+        MetricsRegistry.shared().register("micro_batcher", self.stats)
+
+    async def submit(self, input: Any, config: RunnableConfig = None) -> Any:
+        """
+        Queues a request for the next batch and waits for its result.
+
+        Args:
+            input (Any): The Runnable input.
+            config (RunnableConfig, optional): The configuration of this request.
+
+        Returns:
+            Any: The result of this request.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((input, config or {}, future))
+        if len(self._pending) >= self.max_batch_size:
+            self.__flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self.__flush)
+        return await future
+
+    def __flush(self) -> None:
+        """
+        Dispatches the waiting requests as one batch.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self.__dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def __dispatch(self, batch: List[Tuple[Any, RunnableConfig, asyncio.Future]]) -> None:
+        """
+        Runs a batch with abatch and fans the results, or errors, out to the waiters.
+        """
+        batch = [item for item in batch if not item[2].cancelled()]
+        if not batch:
+            return
+        self.batches += 1
+        self.requests += len(batch)
+        logger.debug(f"[MICRO_BATCHER] {self.runnable.name} dispatching {len(batch)} requests.")
+        try:
+            results = await self.runnable.abatch([input for input, _, _ in batch],
+                                                 [config for _, config, _ in batch],
+                                                 return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the batching counters.
+
+        Returns:
+            Dict[str, float]: Number of batches, batched requests and average batch size.
+        """
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+        }
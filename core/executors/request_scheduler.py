@@ -0,0 +1,473 @@
+import asyncio, json, os, threading, time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple, Union
+from langchain_core.messages import BaseMessage, BaseMessageChunk
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableBinding, RunnableConfig, RunnableLambda
+from loguru import logger
+from core.executors.retry_policy import RetryPolicy
+from core.utils.token_counter import count_messages_tokens, count_tokens
+from core.utils.metrics import MetricsRegistry
+
+# Priority classes, lower runs first. Callers may also pass an int
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+# Default pause in seconds after a rate limit error without Retry-After header
+RATE_LIMIT_PAUSE = 1.0
+
+class RateLimiter:
+    """
+    Token buckets enforcing the requests-per-minute and tokens-per-minute budgets of one model.
+    Both buckets start full and refill continuously. Thread safe.
+
+    Attributes:
+        requests_per_minute (Optional[int]): Request budget. None is unlimited.
+        tokens_per_minute (Optional[int]): Token budget. None is unlimited.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        """
+        Initializes the RateLimiter.
+
+        Args:
+            requests_per_minute (int, optional): Request budget. Default is unlimited.
+            tokens_per_minute (int, optional): Token budget. Default is unlimited.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return not self.requests_per_minute and not self.tokens_per_minute and self._paused_until <= time.monotonic()
+
+    def try_acquire(self, tokens: int) -> float:
+        """
+        Takes one request and the tokens from the buckets if both have enough.
+
+        Args:
+            tokens (int): Tokens of the request, capped to the bucket size.
+
+        Returns:
+            float: 0 if the request was admitted, otherwise the seconds to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed, self._updated = now - self._updated, now
+            if self.requests_per_minute:
+                self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+            if self.tokens_per_minute:
+                self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+            wait = max(0.0, self._paused_until - now)
+            if self.requests_per_minute and self._requests < 1:
+                wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute:
+                needed = min(tokens, self.tokens_per_minute)
+                if self._tokens < needed:
+                    wait = max(wait, (needed - self._tokens) * 60 / self.tokens_per_minute)
+            if wait > 0:
+                return wait
+
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= min(tokens, self.tokens_per_minute)
+            return 0.0
+
+    def settle(self, delta: int) -> None:
+        """
+        Corrects the token bucket once the real usage is known.
+
+        Args:
+            delta (int): Tokens used beyond the reservation, negative to refund.
+        """
+        if self.tokens_per_minute:
+            with self._lock:
+                self._tokens = min(self.tokens_per_minute, self._tokens - delta)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops admitting requests for a while, after the provider answered with a rate limit.
+
+        Args:
+            seconds (float): Seconds to pause.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+class _ModelQueue:
+    # Waiting requests of one model: per priority class, one FIFO per session served round-robin
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+        self.queues: Dict[int, "OrderedDict[str, Deque[Tuple[asyncio.Future, int, float]]]"] = {}
+        self.depth = 0
+        self.dispatcher: Optional[asyncio.Task] = None
+
+class RequestScheduler:
+    """
+    Shared scheduler in front of the model providers. Every model call waits for its per-model RPM/TPM
+    budget; waiting calls are admitted by priority class first and round-robin across sessions within a
+    class, so one busy session cannot starve the others. Rate limit errors pause the model.
+
+    Limits come from LLM_REQUESTS_PER_MINUTE and LLM_TOKENS_PER_MINUTE (every model) and LLM_RATE_LIMITS,
+    a JSON object of per-model [requests_per_minute, tokens_per_minute]. Models without limits are not queued.
+    """
+
+    _shared: Optional["RequestScheduler"] = None
+
+    def __init__(self,
+                 requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None,
+                 limits: Optional[Dict[str, Tuple[Optional[int], Optional[int]]]] = None):
+        """
+        Initializes the RequestScheduler.
+
+        Args:
+            requests_per_minute (int, optional): Default request budget per model. Default is unlimited.
+            tokens_per_minute (int, optional): Default token budget per model. Default is unlimited.
+            limits (Dict[str, Tuple[int, int]], optional): Per-model (requests_per_minute, tokens_per_minute).
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.limits = dict(limits or {})
+        self._models: Dict[str, _ModelQueue] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @classmethod
+    def shared(cls) -> "RequestScheduler":
+        """
+        Returns the process-wide scheduler, configured from the environment on first use.
+
+        Returns:
+            RequestScheduler: The shared scheduler.
+        """
+        if cls._shared is None:
+            rpm, tpm = os.environ.get("LLM_REQUESTS_PER_MINUTE"), os.environ.get("LLM_TOKENS_PER_MINUTE")
+            limits = json.loads(os.environ.get("LLM_RATE_LIMITS") or "{}")
+            cls._shared = cls(requests_per_minute=int(rpm) if rpm else None,
+                              tokens_per_minute=int(tpm) if tpm else None,
+                              limits={model: tuple(limit) for model, limit in limits.items()})
+            MetricsRegistry.shared().register("scheduler", cls._shared.stats)
+        return cls._shared
+
+    def set_limits(self, model: str, requests_per_minute: Optional[int], tokens_per_minute: Optional[int]) -> None:
+        """
+        Sets the budgets of a model, replacing its current buckets.
+
+        Args:
+            model (str): The model name.
+            requests_per_minute (Optional[int]): Request budget. None is unlimited.
+            tokens_per_minute (Optional[int]): Token budget. None is unlimited.
+        """
+        with self._lock:
+            self.limits[model] = (requests_per_minute, tokens_per_minute)
+            if model in self._models:
+                self._models[model].limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    def limiter(self, model: str) -> RateLimiter:
+        return self.__model(model).limiter
+
+    def __model(self, model: str) -> _ModelQueue:
+        """
+        Returns the queue of a model, creating its limiter on first use.
+        """
+        queue = self._models.get(model)
+        if queue is None:
+            with self._lock:
+                queue = self._models.get(model)
+                if queue is None:
+                    rpm, tpm = self.limits.get(model, (self.requests_per_minute, self.tokens_per_minute))
+                    queue = self._models[model] = _ModelQueue(RateLimiter(rpm, tpm))
+        return queue
+
+    async def acquire(self, model: str, tokens: int, priority: Union[str, int] = "normal", session_id: str = None) -> float:
+        """
+        Waits until a call to the model is within budget and its turn has come.
+
+        Args:
+            model (str): The model name.
+            tokens (int): Estimated tokens of the call (prompt and completion).
+            priority (Union[str, int], optional): Priority class, "high", "normal", "low" or an int. Default is "normal".
+            session_id (str, optional): Session of the call, used for fair queuing.
+
+        Returns:
+            float: Seconds waited.
+        """
+        queue = self.__model(model)
+        if queue.depth == 0 and (queue.limiter.unlimited or queue.limiter.try_acquire(tokens) == 0):
+            self.__record(0.0)
+            return 0.0
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        start = time.monotonic()
+        level = PRIORITIES.get(priority, PRIORITIES["normal"]) if isinstance(priority, str) else int(priority)
+        sessions = queue.queues.setdefault(level, OrderedDict())
+        sessions.setdefault(session_id or "", deque()).append((future, tokens, start))
+        queue.depth += 1
+        if queue.dispatcher is None or queue.dispatcher.done() or queue.dispatcher.get_loop() is not loop:
+            queue.dispatcher = loop.create_task(self.__dispatch(queue))
+
+        await future
+        waited = time.monotonic() - start
+        self.__record(waited, queued=True)
+        if waited > 1:
+            logger.debug(f"[SCHEDULER] {model} call waited {waited:.2f}s, {queue.depth} still queued.")
+        return waited
+
+    def acquire_sync(self, model: str, tokens: int) -> float:
+        """
+        Blocking variant of acquire for synchronous callers. It honors the budgets but bypasses the queue:
+        priority and session fairness only apply among async callers, and a sync caller may take budget
+        ahead of queued async calls. The agents serve requests through the async path.
+
+        Args:
+            model (str): The model name.
+            tokens (int): Estimated tokens of the call.
+
+        Returns:
+            float: Seconds waited.
+        """
+        limiter, start = self.__model(model).limiter, time.monotonic()
+        while not limiter.unlimited and (delay := limiter.try_acquire(tokens)) > 0:
+            time.sleep(delay)
+        waited = time.monotonic() - start
+        self.__record(waited, queued=waited > 0)
+        return waited
+
+    async def __dispatch(self, queue: _ModelQueue) -> None:
+        """
+        Admits the waiting calls of a model in order, sleeping while the budget is exhausted.
+        Stops when the queue is empty.
+        """
+        while True:
+            head = self.__head(queue)
+            if head is None:
+                return
+            level, session, (future, tokens, _) = head
+            delay = queue.limiter.try_acquire(tokens)
+            if delay > 0:
+                # Look at the head again afterwards, a higher priority call may have arrived meanwhile
+                await asyncio.sleep(delay)
+                continue
+
+            sessions = queue.queues[level]
+            sessions[session].popleft()
+            queue.depth -= 1
+            if sessions[session]:
+                sessions.move_to_end(session)
+            else:
+                del sessions[session]
+            if future.done():
+                queue.limiter.settle(-tokens)
+            else:
+                future.set_result(None)
+
+    @staticmethod
+    def __head(queue: _ModelQueue) -> Optional[Tuple[int, str, Tuple[asyncio.Future, int, float]]]:
+        """
+        Returns the next call to admit: highest priority class, then the session that waited longest for
+        its turn. Cancelled calls are dropped on the way.
+        """
+        for level in sorted(queue.queues):
+            sessions = queue.queues[level]
+            for session in list(sessions):
+                waiters = sessions[session]
+                while waiters and waiters[0][0].done():
+                    waiters.popleft()
+                    queue.depth -= 1
+                if waiters:
+                    return level, session, waiters[0]
+                del sessions[session]
+        return None
+
+    def settle(self, model: str, delta: int) -> None:
+        """
+        Corrects the token budget of a model with the real usage of a call.
+
+        Args:
+            model (str): The model name.
+            delta (int): Tokens used beyond the reservation, negative to refund.
+        """
+        self.__model(model).limiter.settle(delta)
+
+    def throttled(self, model: str, error: BaseException) -> None:
+        """
+        Pauses a model when the provider answered with a rate limit, for the Retry-After delay if given.
+        Other errors are ignored.
+
+        Args:
+            model (str): The model name.
+            error (BaseException): The error raised by the call.
+        """
+        if getattr(error, "status_code", None) == 429 or "RateLimit" in type(error).__name__:
+            pause = RetryPolicy.retry_after(error) or RATE_LIMIT_PAUSE
+            logger.warning(f"[SCHEDULER] {model} rate limited, pausing for {pause:.2f}s.")
+            self.__model(model).limiter.pause(pause)
+
+    def __record(self, waited: float, queued: bool = False) -> None:
+        self.requests += 1
+        self.queued += queued
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def queue_depth(self, model: Optional[str] = None) -> int:
+        """
+        Returns the number of waiting calls.
+
+        Args:
+            model (Optional[str]): The model name. None counts every model.
+
+        Returns:
+            int: Number of waiting calls.
+        """
+        if model is not None:
+            return self._models[model].depth if model in self._models else 0
+        return sum(queue.depth for queue in self._models.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the queue depth and wait time counters.
+
+        Returns:
+            Dict[str, Any]: Admitted and queued calls, average and maximum wait, and queue depth per model.
+        """
+        return {
+            "requests": self.requests,
+            "queued": self.queued,
+            "avg_wait": self.total_wait / self.requests if self.requests else 0.0,
+            "max_wait": self.max_wait,
+            "queue_depth": {model: queue.depth for model, queue in self._models.items()},
+        }
+
+class ScheduledModel:
+    """
+    Routes the calls of a chat model through a RequestScheduler, between the prompt and the model of an
+    agent runnable. The rendered prompt and the bound tool schemas are counted before the call; the
+    reservation is corrected with the reported usage afterwards, and refunded when the call fails.
+    Priority comes from the "priority" metadata of the config and fair queuing from its session_id;
+    synchronous calls only wait for the budget (see RequestScheduler.acquire_sync).
+
+    Attributes:
+        model (Runnable): The chat model, usually llm.bind_tools(tools).
+        scheduler (RequestScheduler): The scheduler.
+        model_name (str): Name of the model, selecting its budgets and encoding.
+        completion_tokens (int): Tokens reserved for the answer.
+    """
+
+    def __init__(self, model: Runnable, scheduler: RequestScheduler, completion_tokens: int = 256):
+        """
+        Initializes the ScheduledModel. The tool schemas are counted once.
+
+        Args:
+            model (Runnable): The chat model, optionally bound to tools.
+            scheduler (RequestScheduler): The scheduler.
+            completion_tokens (int, optional): Tokens reserved for the answer when the model sets no
+                max_tokens. Default is 256.
+        """
+        self.model = model
+        self.scheduler = scheduler
+        llm, kwargs = (model.bound, model.kwargs) if isinstance(model, RunnableBinding) else (model, {})
+        self.model_name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+        self.completion_tokens = getattr(llm, "max_tokens", None) or completion_tokens
+        tools = kwargs.get("tools")
+        self.tools_tokens = count_tokens(json.dumps(tools, default=str), self.model_name) if tools else 0
+
+    def as_runnable(self) -> Runnable:
+        return _ScheduledRunnable(self)
+
+    def tokens(self, input: PromptValue) -> int:
+        """
+        Estimates the tokens of a call: rendered messages, tool schemas and the answer reservation.
+
+        Args:
+            input (PromptValue): The rendered prompt.
+
+        Returns:
+            int: Estimated tokens.
+        """
+        return count_messages_tokens(input.to_messages(), self.model_name) + self.tools_tokens + self.completion_tokens
+
+    def invoke(self, input: PromptValue, config: RunnableConfig = None) -> BaseMessage:
+        reserved = self.tokens(input)
+        self.scheduler.acquire_sync(self.model_name, reserved)
+        result = None
+        try:
+            result = self.model.invoke(input, config=config)
+        except Exception as e:
+            self.scheduler.throttled(self.model_name, e)
+            raise
+        finally:
+            self.__settle(result, reserved)
+        return result
+
+    async def ainvoke(self, input: PromptValue, config: RunnableConfig = None) -> BaseMessage:
+        config = config or {}
+        reserved = await self.__acquire(input, config)
+        result = None
+        try:
+            result = await self.model.ainvoke(input, config=config)
+        except Exception as e:
+            self.scheduler.throttled(self.model_name, e)
+            raise
+        finally:
+            self.__settle(result, reserved)
+        return result
+
+    async def astream(self, input: PromptValue, config: RunnableConfig = None) -> AsyncIterator[BaseMessageChunk]:
+        config = config or {}
+        reserved = await self.__acquire(input, config)
+        result, done = None, False
+        try:
+            async for chunk in self.model.astream(input, config=config):
+                result = chunk if result is None else result + chunk
+                yield chunk
+            done = True
+        except Exception as e:
+            self.scheduler.throttled(self.model_name, e)
+            raise
+        finally:
+            self.__settle(result if done else None, reserved)
+
+    async def __acquire(self, input: PromptValue, config: RunnableConfig) -> int:
+        """
+        Waits for the turn of an async call and returns the tokens reserved for it.
+        """
+        reserved = self.tokens(input)
+        await self.scheduler.acquire(self.model_name,
+                                     reserved,
+                                     priority=config.get("metadata", {}).get("priority", "normal"),
+                                     session_id=config.get("configurable", {}).get("session_id"))
+        return reserved
+
+    def __settle(self, result: Optional[BaseMessage], reserved: int) -> None:
+        """
+        Corrects the token budget with the usage reported by the provider, when available. A call that
+        failed or was cancelled (no result) gives its reservation back.
+        """
+        if result is None:
+            self.scheduler.settle(self.model_name, -reserved)
+            return
+        usage = getattr(result, "usage_metadata", None)
+        if usage and usage.get("total_tokens"):
+            self.scheduler.settle(self.model_name, usage["total_tokens"] - reserved)
+
+class _ScheduledRunnable(RunnableLambda):
+    # Runnable of a ScheduledModel: ainvoke awaits the model once instead of draining astream
+
+    def __init__(self, scheduled: ScheduledModel):
+        super().__init__(scheduled.invoke, afunc=scheduled.astream, name="scheduled_model")
+        self.scheduled = scheduled
+
+    async def ainvoke(self, input: PromptValue, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        return await self._acall_with_config(self.scheduled.ainvoke, input, config, **kwargs)
@@ -0,0 +1,277 @@
+import json, hashlib, sqlite3, threading, time, uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, BaseMessageChunk, message_to_dict, messages_from_dict
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableBinding, RunnableConfig, RunnableLambda
+from loguru import logger
+from core.utils.metrics import MetricsRegistry
+
+class ResponseCache:
+    """
+    Base class of the response caches: exact-match lookups with TTL, bounded size and hit-rate counters.
+    Subclasses implement _get, _set and _clear.
+
+    Attributes:
+        ttl (Optional[float]): Seconds an answer stays valid. None never expires.
+        max_entries (int): Maximum number of cached answers.
+    """
+
+    def __init__(self, ttl: Optional[float] = 3600.0, max_entries: int = 10000):
+        """
+        Initializes the ResponseCache.
+
+        Args:
+            ttl (float, optional): Seconds an answer stays valid. Default is one hour. None never expires.
+            max_entries (int, optional): Maximum number of cached answers. Default is 10000.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        MetricsRegistry.shared().register("response_cache", self.stats)
+
+    def get(self, key: str) -> Optional[BaseMessage]:
+        """
+        Returns the cached answer for the key, if present and not expired.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Optional[BaseMessage]: The cached answer.
+        """
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return messages_from_dict([json.loads(value)])[0]
+
+    def set(self, key: str, message: BaseMessage) -> None:
+        """
+        Stores an answer.
+
+        Args:
+            key (str): The cache key.
+            message (BaseMessage): The model answer.
+        """
+        self._set(key, json.dumps(message_to_dict(message)))
+
+    def clear(self) -> None:
+        self._clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the cache counters.
+
+        Returns:
+            Dict[str, float]: Hits, misses, evictions and hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+    def _clear(self) -> None:
+        raise NotImplementedError
+
+class InMemoryResponseCache(ResponseCache):
+    # LRU response cache kept in the process memory
+
+    def __init__(self, ttl: Optional[float] = 3600.0, max_entries: int = 10000):
+        super().__init__(ttl=ttl, max_entries=max_entries)
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[1]):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteResponseCache(ResponseCache):
+    # Response cache stored in a SQLite file, shared by the processes of the same host
+
+    def __init__(self, path: str = "response_cache.sqlite", ttl: Optional[float] = 3600.0, max_entries: int = 100000):
+        """
+        Initializes the SQLiteResponseCache.
+
+        Args:
+            path (str, optional): Path of the SQLite database. Default is response_cache.sqlite.
+            ttl (float, optional): Seconds an answer stays valid. Default is one hour. None never expires.
+            max_entries (int, optional): Maximum number of cached answers. Default is 100000.
+        """
+        super().__init__(ttl=ttl, max_entries=max_entries)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache (accessed)")
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM response_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1]):
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE response_cache SET accessed = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def _set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?)", (key, value, now, now))
+            excess = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM response_cache WHERE key IN "
+                    "(SELECT key FROM response_cache ORDER BY accessed LIMIT ?)", (excess,))
+                self.evictions += excess
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+
+class CachedModel:
+    """
+    Puts a ResponseCache in front of a chat model, between the prompt and the model of an agent runnable.
+    The key hashes the rendered messages, the model parameters and the bound tool schemas; hits skip the
+    network and are also served to streaming callers. Answers with tool calls are replayed with fresh tool
+    call ids.
+
+    Attributes:
+        model (Runnable): The chat model, usually llm.bind_tools(tools).
+        cache (ResponseCache): The cache backend.
+    """
+
+    def __init__(self, model: Runnable, cache: ResponseCache, key_model: Runnable = None):
+        """
+        Initializes the CachedModel. The model and tools part of the key is computed once.
+
+        Args:
+            model (Runnable): The chat model, optionally bound to tools.
+            cache (ResponseCache): The cache backend.
+            key_model (Runnable, optional): The chat model the key is computed from, when model wraps it
+                (e.g. a ScheduledModel). Default is model.
+        """
+        self.model = model
+        self.cache = cache
+        key_model = key_model or model
+        llm, kwargs = (key_model.bound, key_model.kwargs) if isinstance(key_model, RunnableBinding) else (key_model, {})
+        self.llm_string = llm._get_llm_string(**kwargs) if isinstance(llm, BaseChatModel) else repr(key_model)
+
+    def as_runnable(self) -> Runnable:
+        return RunnableLambda(self.invoke, afunc=self.astream, name="cached_model")
+
+    def key(self, input: PromptValue) -> str:
+        """
+        Builds the cache key of a rendered prompt. Message ids and metadata are left out, and tool call ids are
+        numbered in order of appearance, since every answer gets fresh ones.
+
+        Args:
+            input (PromptValue): The rendered prompt.
+
+        Returns:
+            str: The key.
+        """
+        call_ids: Dict[str, int] = {}
+        number = lambda call_id: call_ids.setdefault(call_id, len(call_ids)) if call_id is not None else None
+        messages = [
+            (message.type,
+             message.content,
+             [(call["name"], call["args"], number(call.get("id"))) for call in getattr(message, "tool_calls", None) or []],
+             number(getattr(message, "tool_call_id", None)))
+            for message in input.to_messages()
+        ]
+        payload = json.dumps([self.llm_string, messages], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def invoke(self, input: PromptValue, config: RunnableConfig = None) -> BaseMessage:
+        key = self.key(input)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self.__replay(cached)
+        result = self.model.invoke(input, config=config)
+        self.__store(key, result)
+        return result
+
+    async def astream(self, input: PromptValue, config: RunnableConfig = None) -> AsyncIterator[BaseMessageChunk]:
+        key = self.key(input)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.debug(f"[RESPONSE_CACHE] Hit {key[:12]}.")
+            cached = self.__replay(cached)
+            yield AIMessageChunk(content=cached.content,
+                                 additional_kwargs=cached.additional_kwargs,
+                                 tool_calls=getattr(cached, "tool_calls", []))
+            return
+
+        result = None
+        async for chunk in self.model.astream(input, config=config):
+            result = chunk if result is None else result + chunk
+            yield chunk
+        if result is not None:
+            self.__store(key, result)
+
+    @staticmethod
+    def __replay(cached: AIMessage) -> AIMessage:
+        """
+        Returns a cached answer with fresh tool call ids, so the tool messages of two hits never collide.
+        """
+        ids = {call["id"]: f"call_{uuid.uuid4().hex[:24]}" for call in cached.tool_calls if call.get("id")}
+        if not ids:
+            return cached
+        additional_kwargs = dict(cached.additional_kwargs)
+        if additional_kwargs.get("tool_calls"):
+            additional_kwargs["tool_calls"] = [{**call, "id": ids.get(call.get("id"), call.get("id"))}
+                                               for call in additional_kwargs["tool_calls"]]
+        return AIMessage(content=cached.content,
+                         additional_kwargs=additional_kwargs,
+                         tool_calls=[{**call, "id": ids.get(call["id"], call["id"])} for call in cached.tool_calls])
+
+    def __store(self, key: str, result: BaseMessage) -> None:
+        """
+        Caches an answer, unless it is empty.
+        """
+        if not result.content and not getattr(result, "tool_calls", None):
+            return
+        self.cache.set(key, AIMessage(content=result.content,
+                                      additional_kwargs=result.additional_kwargs,
+                                      tool_calls=getattr(result, "tool_calls", [])))
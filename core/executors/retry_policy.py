@@ -0,0 +1,214 @@
+import asyncio, random, time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type
+
+# HTTP status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class RetryPolicy:
+    """
+    Decides whether and when a failed call is retried: exponential backoff with full jitter, only for
+    retryable errors, honoring the Retry-After header of rate limits and an overall deadline.
+
+    Attributes:
+        max_attempts (int): Maximum number of attempts, including the first one.
+        base_delay (float): Delay in seconds before the first retry, doubled on every attempt.
+        max_delay (float): Upper bound for a single delay in seconds.
+        deadline (Optional[float]): Overall time budget in seconds for all the attempts. None has no budget.
+        jitter (bool): Whether to randomize the delays (full jitter).
+    """
+
+    def __init__(self,
+                 max_attempts: int = 2,
+                 base_delay: float = 0.5,
+                 max_delay: float = 20.0,
+                 deadline: Optional[float] = None,
+                 jitter: bool = True,
+                 retryable_errors: Tuple[Type[BaseException], ...] = (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        """
+        Initializes the RetryPolicy.
+
+        Args:
+            max_attempts (int, optional): Maximum number of attempts, including the first one. Default is 2.
+            base_delay (float, optional): Delay in seconds before the first retry. Default is 0.5.
+            max_delay (float, optional): Upper bound for a single delay in seconds. Default is 20.
+            deadline (float, optional): Overall time budget in seconds. Default has no budget.
+            jitter (bool, optional): Whether to randomize the delays. Default is True.
+            retryable_errors (Tuple[Type[BaseException], ...], optional): Exception types always retried,
+                besides the provider errors with a retryable status code, timeout or connection error.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.jitter = jitter
+        self.retryable_errors = retryable_errors
+
+    def is_retryable(self, error: BaseException) -> bool:
+        """
+        Checks whether an error is transient. Provider errors are classified by status code or by their
+        timeout/connection type, without importing the provider SDKs.
+
+        Args:
+            error (BaseException): The error raised by the call.
+
+        Returns:
+            bool: True if the call may succeed when retried.
+        """
+        if isinstance(error, self.retryable_errors):
+            return True
+        status_code = getattr(error, "status_code", None)
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES
+        return any(name in type(error).__name__ for name in ("Timeout", "Connection", "RateLimit"))
+
+    @staticmethod
+    def retry_after(error: BaseException) -> Optional[float]:
+        """
+        Reads the delay requested by the provider in the Retry-After (or retry-after-ms) header.
+
+        Args:
+            error (BaseException): The error raised by the call.
+
+        Returns:
+            Optional[float]: The requested delay in seconds, if any.
+        """
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if not headers:
+            return None
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            value = headers.get("retry-after")
+            if not value:
+                return None
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def next_delay(self, attempt: int, error: BaseException, elapsed: float) -> Optional[float]:
+        """
+        Returns the delay before the next attempt, or None if the call must not be retried.
+
+        Args:
+            attempt (int): Number of attempts already made.
+            error (BaseException): The error raised by the last attempt.
+            elapsed (float): Seconds since the first attempt started.
+
+        Returns:
+            Optional[float]: Seconds to wait before retrying, or None to give up.
+        """
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return None
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        if self.deadline is not None and elapsed + delay >= self.deadline:
+            return None
+        return delay
+
+    def remaining(self, elapsed: float) -> Optional[float]:
+        """
+        Returns the time left before the deadline.
+
+        Args:
+            elapsed (float): Seconds since the first attempt started.
+
+        Returns:
+            Optional[float]: Seconds left, or None if there is no deadline.
+        """
+        return None if self.deadline is None else max(0.0, self.deadline - elapsed)
+
+class HedgePolicy:
+    """
+    Hedged requests: when a call takes longer than a percentile of the recent latencies, a second identical
+    call is fired and the first one to succeed wins; the other is cancelled.
+
+    Attributes:
+        percentile (float): Latency percentile after which the hedge is fired.
+        min_samples (int): Latencies needed before hedging starts.
+        min_delay (float): Lower bound in seconds for the hedge delay.
+    """
+
+    def __init__(self, percentile: float = 95.0, min_samples: int = 20, window: int = 500, min_delay: float = 0.05):
+        """
+        Initializes the HedgePolicy.
+
+        Args:
+            percentile (float, optional): Latency percentile after which the hedge is fired. Default is 95.
+            min_samples (int, optional): Latencies needed before hedging starts. Default is 20.
+            window (int, optional): Number of recent latencies kept. Default is 500.
+            min_delay (float, optional): Lower bound in seconds for the hedge delay. Default is 0.05.
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = deque(maxlen=window)
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, latency: float) -> None:
+        self.latencies.append(latency)
+
+    def delay(self) -> Optional[float]:
+        """
+        Returns the current hedge delay, or None while there are not enough samples.
+
+        Returns:
+            Optional[float]: Seconds to wait before firing the hedge.
+        """
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+
+    async def run(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs the call, firing a hedge if it is slower than the hedge delay.
+
+        Args:
+            call (Callable[[], Awaitable[Any]]): Factory of the awaitable to run; called once per request.
+
+        Returns:
+            Any: The result of the first successful request.
+        """
+        start = time.monotonic()
+        delay = self.delay()
+        if delay is None:
+            result = await call()
+            self.record(time.monotonic() - start)
+            return result
+
+        first = asyncio.ensure_future(call())
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(call()))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        self.record(time.monotonic() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
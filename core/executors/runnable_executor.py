@@ -1,9 +1,18 @@
 from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.callbacks import BaseCallbackManager
 from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
-import operator, json
-from typing import Annotated, TypedDict, Union, Callable
+import operator, json, asyncio, time
+from typing import Annotated, AsyncIterator, TypedDict, Union, Callable
 from langchain_core.agents import AgentAction, AgentFinish
-from langchain_core.messages import AIMessage, message_to_dict
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessageChunk, message_chunk_to_message, message_to_dict
+from loguru import logger
+from core.executors.retry_policy import HedgePolicy, RetryPolicy
+from core.executors.micro_batcher import MicroBatcher
+from core.utils.metrics import MetricsCallbackHandler, MetricsRegistry
+
+# Metadata flag that raises the final error instead of answering with the failure message,
+# e.g. executor(state, config={"metadata": {RAISE_ON_FAILURE: True}})
+RAISE_ON_FAILURE = "raise_on_failure"
 
 class AgentState(TypedDict):
     """
@@ -28,19 +37,98 @@ class RunnableExecutor:
         runnable (Runnable): The Runnable object to execute.
         name (str): The name of the Runnable.
         max_retries (int): Maximum number of retries.
+        retry_policy (RetryPolicy): Backoff, error classification and deadline of the retries.
+        hedge_policy (Optional[HedgePolicy]): Hedged requests policy, if enabled.
+        batch_window (Optional[float]): Seconds concurrent calls wait to be coalesced into one abatch, if enabled.
+        max_batch_size (int): Maximum number of calls per batch.
+        priority (str): Priority class of the model calls in the RequestScheduler.
+        raise_on_failure (bool): Whether the final error is raised instead of answered with the failure message.
     """
 
-    def __init__(self, runnable: Runnable, max_retries: int = 2):
+    def __init__(self,
+                 runnable: Runnable,
+                 max_retries: int = 2,
+                 retry_policy: RetryPolicy = None,
+                 hedge_policy: HedgePolicy = None,
+                 batch_window: float = None,
+                 max_batch_size: int = 16,
+                 priority: str = "normal",
+                 raise_on_failure: bool = False):
         """
         Initializes RunnableExecutor with the Runnable and the maximum number of retries.
 
         Args:
             runnable (Runnable): The Runnable object to execute.
             max_retries (int, optional): Maximum number of retries. Default is 2.
+            retry_policy (RetryPolicy, optional): Retry policy. Default is exponential backoff with jitter
+                over max_retries attempts, only for retryable errors.
+            hedge_policy (HedgePolicy, optional): Fires a second request when the first one is slower than
+                a latency percentile. Default disables hedging.
+            batch_window (float, optional): Seconds concurrent calls wait to be coalesced into one abatch call.
+                Only useful with a runnable implementing abatch natively, see MicroBatcher; otherwise it only adds
+                latency. Default disables micro-batching.
+            max_batch_size (int, optional): Maximum number of calls per batch. Default is 16.
+            priority (str, optional): Priority class ("high", "normal" or "low") of the model calls in the
+                shared RequestScheduler, unless the config metadata sets one. Default is "normal".
+            raise_on_failure (bool, optional): Raises the error once the retries are exhausted instead of answering
+                "I cannot resolve the task. Retry.", unless the config metadata sets RAISE_ON_FAILURE. Default is False.
         """
         self.runnable = runnable
         self.name = runnable.name
         self.max_retries = max_retries
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries)
+        self.hedge_policy = hedge_policy
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.micro_batcher = None
+        self.priority = priority
+        self.raise_on_failure = raise_on_failure
+        self.metrics = MetricsRegistry.shared()
+        self.metrics_handler = MetricsCallbackHandler(self.metrics)
+
+    def _prepare_config(self, config: RunnableConfig) -> RunnableConfig:
+        """
+        Adds the priority class and the agent name to the config metadata, read by the RequestScheduler and
+        the metrics, and the metrics callback handler to its callbacks.
+
+        Args:
+            config (RunnableConfig): The configuration for the execution.
+
+        Returns:
+            RunnableConfig: A copy of the configuration.
+        """
+        config = config or {}
+        callbacks = config.get("callbacks")
+        if isinstance(callbacks, BaseCallbackManager):
+            callbacks = callbacks.copy()
+            callbacks.add_handler(self.metrics_handler, inherit=True)
+        else:
+            callbacks = list(callbacks or []) + [self.metrics_handler]
+        metadata = {"priority": self.priority, "agent": self.name, **config.get("metadata", {})}
+        return {**config, "metadata": metadata, "callbacks": callbacks}
+
+    def _raises(self, config: RunnableConfig) -> bool:
+        """
+        Returns whether a final failure is raised for this call, e.g. so an AgentGraph keeps the node pending.
+        """
+        return bool((config or {}).get("metadata", {}).get(RAISE_ON_FAILURE, self.raise_on_failure))
+
+    async def _ainvoke_runnable(self, state: AgentState, config: RunnableConfig):
+        """
+        Invokes self.runnable, through the micro-batcher when batching is enabled.
+
+        Args:
+            state (AgentState): The state of the agent.
+            config (RunnableConfig): The configuration for the execution.
+
+        Returns:
+            BaseMessage: The result of the Runnable execution.
+        """
+        if self.batch_window is None:
+            return await self.runnable.ainvoke(state, config=config)
+        if self.micro_batcher is None:
+            self.micro_batcher = MicroBatcher(self.runnable, max_batch_size=self.max_batch_size, max_wait=self.batch_window)
+        return await self.micro_batcher.submit(state, config)
 
     async def __invoke(self, state: AgentState, config: RunnableConfig):
         """
@@ -53,7 +141,7 @@ class RunnableExecutor:
         Returns:
             BaseMessage: The result of the Runnable execution.
         """
-        result = await self.runnable.ainvoke(state, config=config)
+        result = await self._ainvoke_runnable(state, config)
 
         # Ensure tool call responses are handled properly
         if not result.additional_kwargs.get('tool_calls', []) and (
@@ -77,27 +165,93 @@ class RunnableExecutor:
         Returns:
             dict: Dictionary with the resulting message or an error message in case of failure.
         """
-        for i in range(self.max_retries):
+        invoke = invoke_funk or self.__invoke
+        config = self._prepare_config(config)
+        start, attempt = time.monotonic(), 0
+        while True:
             try:
-                result = await self.__invoke(state, config) if not invoke_funk else await invoke_funk(state, config)
+                call = lambda: invoke(state, config)
+                attempt_call = self.hedge_policy.run(call) if self.hedge_policy else call()
+                timeout = self.retry_policy.remaining(time.monotonic() - start)
+                result = await asyncio.wait_for(attempt_call, timeout) if timeout is not None else await attempt_call
                 break
-            except Exception:
-                if i == self.max_retries - 1:
+            except Exception as e:
+                attempt += 1
+                delay = self.retry_policy.next_delay(attempt, e, time.monotonic() - start)
+                if delay is None:
+                    logger.warning(f"[EXECUTOR] {self.name} failed after {attempt} attempts: {e!r}")
+                    self.metrics.increment("errors", stage="turn", agent=self.name)
+                    self.metrics.observe("turn", time.monotonic() - start, agent=self.name)
+                    if self._raises(config):
+                        raise
                     return {"messages": AIMessage(content="I cannot resolve the task. Retry.")}
+                logger.debug(f"[EXECUTOR] {self.name} attempt {attempt} failed ({e!r}), retrying in {delay:.2f}s.")
+                self.metrics.increment("retries", agent=self.name)
+                await asyncio.sleep(delay)
 
+        self.metrics.observe("turn", time.monotonic() - start, agent=self.name)
         if isinstance(result, BaseMessage):
             result = self.__get_message_type(result)
         
         return {"messages": result}
 
+    async def astream(self, state: AgentState, config: RunnableConfig) -> AsyncIterator[BaseMessageChunk]:
+        """
+        Streams the Runnable output chunk by chunk, with retries while nothing has been streamed yet.
+        Once the stream ends, the assembled message goes through the same empty output check as __call__.
+
+        Args:
+            state (AgentState): The state of the agent.
+            config (RunnableConfig): The configuration for the execution.
+
+        Yields:
+            BaseMessageChunk: The chunks of the response, or the error message in case of failure.
+        """
+        config = self._prepare_config(config)
+        start, attempt = time.monotonic(), 0
+        while True:
+            result = None
+            try:
+                async for chunk in self.runnable.astream(state, config=config):
+                    if result is None:
+                        self.metrics.observe("first_token", time.monotonic() - start, agent=self.name)
+                    result = chunk if result is None else result + chunk
+                    yield chunk
+                break
+            except Exception as e:
+                attempt += 1
+                # A partially streamed answer cannot be retried without repeating it
+                delay = None if result is not None else self.retry_policy.next_delay(attempt, e, time.monotonic() - start)
+                if delay is None:
+                    logger.warning(f"[EXECUTOR] {self.name} stream failed after {attempt} attempts: {e!r}")
+                    self.metrics.increment("errors", stage="turn", agent=self.name)
+                    self.metrics.observe("turn", time.monotonic() - start, agent=self.name)
+                    if self._raises(config):
+                        raise
+                    yield AIMessageChunk(content="I cannot resolve the task. Retry.")
+                    return
+                logger.debug(f"[EXECUTOR] {self.name} attempt {attempt} failed ({e!r}), retrying in {delay:.2f}s.")
+                self.metrics.increment("retries", agent=self.name)
+                await asyncio.sleep(delay)
+        self.metrics.observe("turn", time.monotonic() - start, agent=self.name)
+
+        # Ensure tool call responses are handled properly
+        if result is not None and not result.additional_kwargs.get('tool_calls', []) and (
+            not result.content
+            or isinstance(result.content, list) and not result.content[0].get("text")
+        ):
+            human_message_handle = HumanMessage(content="Please provide a valid output.")
+            state["messages"].append(human_message_handle)
+
     def __get_message_type(self, from_: BaseMessage):
         """
-        Returns the message type from the base message.
+        Returns the message type from the base message. The aggregated chunks of a streamed answer become
+        the plain message.
 
         Args:
             from_ (BaseMessage): The base message.
 
         Returns:
-            BaseMessage: The original message.
+            BaseMessage: The original message, or the plain message of a chunk.
         """
-        return from_
+        return message_chunk_to_message(from_)
@@ -1,13 +1,22 @@
-import os, operator, json
+import importlib, os, operator, json
 from core.executors.runnable_executor import RunnableExecutor
 from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
-from typing import Annotated, TypedDict, Union, Callable
+from typing import TYPE_CHECKING, Annotated, AsyncIterator, TypedDict, Union, Callable
 from langchain_core.agents import AgentAction, AgentFinish
-from langchain_core.messages import AIMessage, message_to_dict
+from langchain_core.messages import AIMessage, BaseMessageChunk, message_to_dict
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_mongodb import MongoDBChatMessageHistory
-from pymongo import errors
+from langchain_core.chat_history import BaseChatMessageHistory
+from core.memory.history_cache import SessionHistoryCache
+from core.executors.retry_policy import HedgePolicy, RetryPolicy
+
+# The MongoDB backends (pymongo, langchain_mongodb, motor) are imported on the first history access,
+# keeping them off the import path of short-lived processes
+if TYPE_CHECKING:
+    from pymongo import MongoClient
+    from core.memory.mongo_chat_history import CustomMongoDBChatMessageHistory
+    from core.memory.history_compactor import HistoryCompactor
+    from core.memory.write_behind_buffer import WriteBehindBuffer
 
 class AgentState(TypedDict):
     """
@@ -30,7 +39,24 @@ class RunnableWithMemoryExecutor(RunnableExecutor):
     Adds the functionality of using message histories to improve decision making and remember previous contexts.
     """
 
-    def __init__(self, runnable: Runnable, max_retries: int = 2):
+    def __init__(self,
+                 runnable: Runnable,
+                 max_retries: int = 2,
+                 mongo_client: "MongoClient" = None,
+                 history_size: int = None,
+                 max_history_tokens: int = None,
+                 token_model: str = None,
+                 compactor: "HistoryCompactor" = None,
+                 history_cache: SessionHistoryCache = None,
+                 async_history: bool = False,
+                 async_mongo_client=None,
+                 write_behind: "WriteBehindBuffer" = None,
+                 retry_policy: RetryPolicy = None,
+                 hedge_policy: HedgePolicy = None,
+                 batch_window: float = None,
+                 max_batch_size: int = 16,
+                 priority: str = "normal",
+                 raise_on_failure: bool = False):
         """
         Initializes an instance of RunnableWithMemoryExecutor, extending the initialization of RunnableExecutor
         to include handling of message history.
@@ -38,8 +64,52 @@ class RunnableWithMemoryExecutor(RunnableExecutor):
         Args:
             runnable (Runnable): The Runnable object to execute.
             max_retries (int): Maximum number of retries. Default is 2.
+            mongo_client (MongoClient, optional): Client for the history backend. Defaults to the shared
+                client from MongoClientPool, reused across sessions and agents.
+            history_size (int, optional): Maximum number of recent messages loaded into the prompt. Default loads all.
+            max_history_tokens (int, optional): Token budget for the loaded history. Default has no budget.
+            token_model (str, optional): Model name used to pick the tiktoken encoding for the budget.
+            compactor (HistoryCompactor, optional): Folds older messages into a rolling summary in the background.
+                When set, the prompt gets the summary plus the recent messages. It works on the blocking backend,
+                so with async_history it needs mongo_client or MONGODB_CONN_STRING. Default disables compaction.
+            history_cache (SessionHistoryCache, optional): In-process LRU cache of the loaded histories, dedicated
+                to this executor. Default reads the history from MongoDB on every turn.
+            async_history (bool): Whether to use the asyncio-native (motor) history backend, so history reads and
+                writes do not block the event loop. Synchronous calls of the history runnable fall back to the
+                blocking backend. Default is False.
+            async_mongo_client (AsyncIOMotorClient, optional): Motor-compatible client for the async backend.
+                Defaults to the shared client from AsyncMongoClientPool.
+            write_behind (WriteBehindBuffer, optional): Buffers the async history writes and flushes them in
+                batches. Call aclose() at shutdown to flush it. Default writes on every turn.
+            retry_policy (RetryPolicy, optional): Retry policy, see RunnableExecutor.
+            hedge_policy (HedgePolicy, optional): Hedged requests policy, see RunnableExecutor. A hedge that finishes
+                together with the winner may also store its answer in the history, so use it with care here.
+            batch_window (float, optional): Micro-batching window, see RunnableExecutor. Each batched call keeps
+                its own session history.
+            max_batch_size (int, optional): Maximum number of calls per batch. Default is 16.
+            priority (str, optional): Priority class of the model calls, see RunnableExecutor. Default is "normal".
+            raise_on_failure (bool, optional): Raises the final error, see RunnableExecutor. Default is False.
         """
-        super().__init__(runnable=runnable, max_retries=max_retries)
+        if compactor is not None and async_history and mongo_client is None and not os.environ.get("MONGODB_CONN_STRING"):
+            raise ValueError("History compaction reads and writes through the blocking backend: "
+                             "pass mongo_client or set MONGODB_CONN_STRING when async_history is used")
+        super().__init__(runnable=runnable,
+                         max_retries=max_retries,
+                         retry_policy=retry_policy,
+                         hedge_policy=hedge_policy,
+                         batch_window=batch_window,
+                         max_batch_size=max_batch_size,
+                         priority=priority,
+                         raise_on_failure=raise_on_failure)
+        self.mongo_client = mongo_client
+        self.history_size = history_size
+        self.max_history_tokens = max_history_tokens
+        self.token_model = token_model
+        self.compactor = compactor
+        self.history_cache = history_cache
+        self.async_history = async_history
+        self.async_mongo_client = async_mongo_client
+        self.write_behind = write_behind
         self.runnable = RunnableWithMessageHistory(
             runnable=runnable,
             get_session_history=self.__get_message_history,
@@ -60,7 +130,7 @@ class RunnableWithMemoryExecutor(RunnableExecutor):
         Returns:
             BaseMessage: Result of the Runnable execution, including history handling.
         """
-        result = await self.runnable.ainvoke(state, config=config)
+        result = await self._ainvoke_runnable(state, config)
 
         # Ensure tool call responses are handled properly
         if not result.additional_kwargs.get('tool_calls', []) and (
@@ -84,9 +154,48 @@ class RunnableWithMemoryExecutor(RunnableExecutor):
         Returns:
             dict: Result of the execution, which may include a message or a modified state.
         """
-        return await super().__call__(state, config, self.__invoke)
+        result = await super().__call__(state, config, self.__invoke)
+        self.__schedule_compaction(config)
+        return result
+
+    async def astream(self, state: AgentState, config: RunnableConfig) -> AsyncIterator[BaseMessageChunk]:
+        """
+        Streams the Runnable output with message history handling. The history stores the assembled
+        final message once the stream ends.
+
+        Args:
+            state (AgentState): Current state of the agent.
+            config (RunnableConfig): Configuration for the execution.
+
+        Yields:
+            BaseMessageChunk: The chunks of the response.
+        """
+        async for chunk in super().astream(state, config):
+            yield chunk
+        self.__schedule_compaction(config)
+
+    def __schedule_compaction(self, config: RunnableConfig) -> None:
+        """
+        Compacts the history of the session off the request path once the turn is stored.
+
+        Args:
+            config (RunnableConfig): Configuration for the execution, holding the session id.
+        """
+        if self.compactor is not None:
+            session_id = (config or {}).get("configurable", {}).get("session_id")
+            if session_id is not None:
+                self.compactor.schedule(session_id, self.__get_sync_message_history)
+
+    async def aclose(self) -> None:
+        """
+        Flushes the buffered history writes and stops the background compaction.
+        """
+        if self.write_behind is not None:
+            await self.write_behind.close()
+        if self.compactor is not None:
+            self.compactor.shutdown(wait=True)
 
-    def __get_message_history(self, session_id: str) -> MongoDBChatMessageHistory:
+    def __get_message_history(self, session_id: str) -> BaseChatMessageHistory:
         """
         Retrieves the message history associated with a given session ID using a MongoDB database.
         
@@ -94,36 +203,55 @@ class RunnableWithMemoryExecutor(RunnableExecutor):
             session_id (str): Identifier of the session for which to retrieve the history.
         
         Returns:
-            MongoDBChatMessageHistory: Object containing the message history of the session.
+            BaseChatMessageHistory: Object containing the message history of the session.
         """
-        result = CustomMongoDBChatMessageHistory(connection_string=os.environ["MONGODB_CONN_STRING"], session_id=session_id)
-        return result
+        if not self.async_history:
+            return self.__get_sync_message_history(session_id)
 
-class CustomMongoDBChatMessageHistory(MongoDBChatMessageHistory):
-    """ Extension of the MongoDBChatMessageHistory class """
+        from core.memory.async_mongo_chat_history import AsyncMongoDBChatMessageHistory
+        return AsyncMongoDBChatMessageHistory(session_id=session_id,
+                                              client=self.async_mongo_client,
+                                              history_size=self.history_size,
+                                              max_history_tokens=self.max_history_tokens,
+                                              token_model=self.token_model,
+                                              use_summary=self.compactor is not None,
+                                              cache=self.history_cache,
+                                              write_behind=self.write_behind,
+                                              sync_client=self.mongo_client)
 
-    def add_message(self, message: BaseMessage) -> None:
+    def __get_sync_message_history(self, session_id: str) -> "CustomMongoDBChatMessageHistory":
         """
-        Append the message to the record in MongoDB.
-        
+        Retrieves the blocking message history of a session, also used by the background compaction.
+
         Args:
-            message (BaseMessage): The message to add to the history.
-        """
-        try:
-            # If the message is not a tool call or a tool response, save it
-            if message_to_dict(message)["data"]["additional_kwargs"].get("tool_calls", None) is None:
-                if message_to_dict(message)["type"] != "tool":
-                    new_message = {
-                        "SessionId": self.session_id,
-                        "History": json.dumps(message_to_dict(message)),
-                    }
-                    if not self.collection.find_one(new_message):
-                        self.collection.insert_one(new_message)
-        except errors.WriteError as err:
-            print(err)
-
-    def clear(self) -> None:
-        """
-        Clear the message history.
-        """
-        return super().clear()
+            session_id (str): Identifier of the session for which to retrieve the history.
+
+        Returns:
+            CustomMongoDBChatMessageHistory: Object containing the message history of the session.
+        """
+        from core.memory.mongo_chat_history import CustomMongoDBChatMessageHistory
+        from core.memory.mongo_client_pool import MongoClientPool
+        client = self.mongo_client or MongoClientPool.get_client(os.environ["MONGODB_CONN_STRING"])
+        result = CustomMongoDBChatMessageHistory(connection_string=None,
+                                                 session_id=session_id,
+                                                 client=client,
+                                                 history_size=self.history_size,
+                                                 max_history_tokens=self.max_history_tokens,
+                                                 token_model=self.token_model,
+                                                 use_summary=self.compactor is not None,
+                                                 cache=self.history_cache)
+        return result
+
+# Names this module used to define or import, re-exported on first access so the MongoDB backends stay lazy
+_LAZY_EXPORTS = {
+    "CustomMongoDBChatMessageHistory": ("core.memory.mongo_chat_history", "CustomMongoDBChatMessageHistory"),
+    "MongoDBChatMessageHistory": ("langchain_mongodb", "MongoDBChatMessageHistory"),
+    "errors": ("pymongo", "errors"),
+}
+
+def __getattr__(name: str):
+    # Keeps `from core.executors.runnable_withmemory_executor import CustomMongoDBChatMessageHistory` working
+    if name in _LAZY_EXPORTS:
+        module_name, attribute = _LAZY_EXPORTS[name]
+        return getattr(importlib.import_module(module_name), attribute)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
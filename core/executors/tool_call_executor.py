@@ -0,0 +1,239 @@
+import asyncio, time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, Dict, List, Optional
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, BaseMessageChunk, ToolMessage
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from langchain_core.tools import BaseTool
+from loguru import logger
+from core.executors.tool_process_pool import ToolProcessPool
+
+class ToolCallExecutor:
+    """
+    Runs the tool calls requested by the model and loops back to it until it answers without tool calls.
+
+    All the tool calls of a model response run concurrently, each in the execution mode its tool declares
+    with @execution_mode: "inline" on the event loop, "thread" in a bounded thread pool, "process" in the
+    shared ToolProcessPool. Undeclared tools run inline when they have their own _arun and in a thread
+    otherwise. Each call has a timeout and the loop is capped at max_iterations model calls.
+
+    Attributes:
+        runnable (Runnable): The model runnable, usually prompt | llm.bind_tools(tools).
+        tools (Dict[str, BaseTool]): The tools, mapped by name.
+        max_iterations (int): Maximum number of model calls per turn.
+        tool_timeout (float): Timeout in seconds for each tool call.
+    """
+
+    def __init__(self,
+                 runnable: Runnable,
+                 tools: List[BaseTool],
+                 max_iterations: int = 5,
+                 tool_timeout: float = 30.0,
+                 max_workers: int = 8):
+        """
+        Initializes the ToolCallExecutor.
+
+        Args:
+            runnable (Runnable): The model runnable returning AIMessages with tool_calls.
+            tools (List[BaseTool]): The tools the model can call.
+            max_iterations (int, optional): Maximum number of model calls per turn. Default is 5.
+            tool_timeout (float, optional): Timeout in seconds for each tool call. Default is 30.
+            max_workers (int, optional): Size of the thread pool for synchronous tools. Default is 8.
+        """
+        self.runnable = runnable
+        self.name = runnable.name
+        self.tools: Dict[str, BaseTool] = {tool.name: tool for tool in tools}
+        self.max_iterations = max_iterations
+        self.tool_timeout = tool_timeout
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        if any(self.mode(tool) == "process" for tool in tools):
+            # Warm the workers now, so the first calls do not pay the process start and imports
+            ToolProcessPool.shared().start()
+
+    def as_runnable(self) -> Runnable:
+        """
+        Wraps the loop in a Runnable, so it can be used wherever the model runnable was used,
+        e.g. inside RunnableWithMessageHistory, which then only stores the input and the final answer.
+        The async side streams the tokens of the final answer.
+
+        Returns:
+            Runnable: The runnable running the tool loop.
+        """
+        return RunnableLambda(self.invoke, afunc=self.astream, name=self.name)
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{self.name}-tools")
+        return self._pool
+
+    @staticmethod
+    def mode(tool: BaseTool) -> str:
+        """
+        Returns the execution mode of a tool.
+
+        Args:
+            tool (BaseTool): The tool.
+
+        Returns:
+            str: "inline", "thread" or "process".
+        """
+        declared = getattr(type(tool), "execution_mode", None)
+        if declared is not None:
+            return declared
+        return "inline" if type(tool)._arun is not BaseTool._arun else "thread"
+
+    async def ainvoke(self, input: dict, config: RunnableConfig = None) -> BaseMessage:
+        """
+        Calls the model and runs its tool calls concurrently until it gives a final answer.
+
+        Args:
+            input (dict): The runnable input, with the conversation in "messages".
+            config (RunnableConfig, optional): The configuration for the execution.
+
+        Returns:
+            BaseMessage: The final model response.
+        """
+        result = None
+        async for chunk in self.astream(input, config):
+            result = chunk if result is None else result + chunk
+        # Only the final response is yielded, so this is the answer of the last iteration alone
+        return self.__as_message(result) if result is not None else result
+
+    async def astream(self, input: dict, config: RunnableConfig = None) -> AsyncIterator[BaseMessageChunk]:
+        """
+        Streams the model responses and runs their tool calls concurrently until the model gives a final answer.
+        Only the chunks of the final answer are yielded, once its response ended without tool calls; responses
+        that request tools are consumed silently, including any text before their tool calls.
+
+        Args:
+            input (dict): The runnable input, with the conversation in "messages".
+            config (RunnableConfig, optional): The configuration for the execution.
+
+        Yields:
+            BaseMessageChunk: The chunks of the final model response.
+        """
+        messages = list(input["messages"])
+        for _ in range(self.max_iterations):
+            # The chunks are held until the response ends: text streamed before a tool call (e.g. "Let me
+            # check.") belongs to a tool-calling response and must reach neither the user nor the answer
+            result, held = None, []
+            async for chunk in self.runnable.astream({**input, "messages": messages}, config=config):
+                result = chunk if result is None else result + chunk
+                held.append(chunk)
+
+            if result is None or not getattr(result, "tool_calls", None):
+                for held_chunk in held:
+                    yield held_chunk
+                return
+            tool_messages = await asyncio.gather(*(self.__arun_tool_call(call, config) for call in result.tool_calls))
+            messages += [self.__as_message(result), *tool_messages]
+
+        logger.debug(f"[TOOL_EXECUTOR] {self.name} reached {self.max_iterations} iterations.")
+        yield AIMessageChunk(content=self.__max_iterations_message().content)
+
+    def invoke(self, input: dict, config: RunnableConfig = None) -> BaseMessage:
+        """
+        Synchronous version of ainvoke. The tool calls of a response run concurrently in the thread pool.
+
+        Args:
+            input (dict): The runnable input, with the conversation in "messages".
+            config (RunnableConfig, optional): The configuration for the execution.
+
+        Returns:
+            BaseMessage: The final model response.
+        """
+        messages = list(input["messages"])
+        for _ in range(self.max_iterations):
+            result = self.runnable.invoke({**input, "messages": messages}, config=config)
+            if not getattr(result, "tool_calls", None):
+                return result
+            futures = [(call, self.pool.submit(self.__run_tool, call, config)) for call in result.tool_calls]
+            # The calls started together, so they share one deadline
+            deadline = time.monotonic() + self.tool_timeout
+            tool_messages = []
+            for call, future in futures:
+                try:
+                    tool_messages.append(future.result(timeout=max(0, deadline - time.monotonic())))
+                except FutureTimeoutError:
+                    tool_messages.append(self.__timeout_message(call))
+            messages += [result, *tool_messages]
+
+        logger.debug(f"[TOOL_EXECUTOR] {self.name} reached {self.max_iterations} iterations.")
+        return self.__max_iterations_message()
+
+    async def __arun_tool_call(self, call: dict, config: RunnableConfig) -> ToolMessage:
+        """
+        Runs a tool call in the execution mode of its tool, with the timeout. On timeout, a process call is
+        cancelled and its worker killed.
+
+        Args:
+            call (dict): The tool call, with name, args and id.
+            config (RunnableConfig): The configuration for the execution.
+
+        Returns:
+            ToolMessage: The tool output, or the error, for the model.
+        """
+        tool = self.tools.get(call["name"])
+        if tool is None:
+            return ToolMessage(content=f"Error: tool {call['name']} does not exist.", tool_call_id=call["id"], name=call["name"])
+
+        mode = self.mode(tool)
+        try:
+            if mode == "inline" and type(tool)._arun is BaseTool._arun:
+                output = tool.invoke(call["args"], config=config)
+            elif mode in ("inline", "process"):
+                output = await asyncio.wait_for(tool.ainvoke(call["args"], config=config), timeout=self.tool_timeout)
+            else:
+                loop = asyncio.get_running_loop()
+                output = await asyncio.wait_for(
+                    loop.run_in_executor(self.pool, lambda: tool.invoke(call["args"], config=config)),
+                    timeout=self.tool_timeout)
+        except asyncio.TimeoutError:
+            return self.__timeout_message(call)
+        except Exception as e:
+            output = repr(e)
+        return ToolMessage(content=str(output), tool_call_id=call["id"], name=call["name"])
+
+    def __run_tool(self, call: dict, config: RunnableConfig) -> ToolMessage:
+        """
+        Runs a tool call synchronously.
+
+        Args:
+            call (dict): The tool call, with name, args and id.
+            config (RunnableConfig): The configuration for the execution.
+
+        Returns:
+            ToolMessage: The tool output, or the error, for the model.
+        """
+        tool = self.tools.get(call["name"])
+        if tool is None:
+            return ToolMessage(content=f"Error: tool {call['name']} does not exist.", tool_call_id=call["id"], name=call["name"])
+        try:
+            output = tool.invoke(call["args"], config=config)
+        except Exception as e:
+            output = repr(e)
+        return ToolMessage(content=str(output), tool_call_id=call["id"], name=call["name"])
+
+    @staticmethod
+    def __as_message(result: BaseMessage) -> BaseMessage:
+        """
+        Turns an aggregated streamed chunk back into a plain AIMessage for the next model call.
+        """
+        if isinstance(result, AIMessageChunk):
+            return AIMessage(content=result.content,
+                             additional_kwargs=result.additional_kwargs,
+                             tool_calls=result.tool_calls,
+                             response_metadata=result.response_metadata,
+                             usage_metadata=result.usage_metadata,
+                             id=result.id)
+        return result
+
+    def __timeout_message(self, call: dict) -> ToolMessage:
+        logger.debug(f"[TOOL_EXECUTOR] Tool {call['name']} timed out after {self.tool_timeout}s.")
+        return ToolMessage(content=f"Error: tool {call['name']} timed out after {self.tool_timeout} seconds.",
+                           tool_call_id=call["id"], name=call["name"])
+
+    def __max_iterations_message(self) -> AIMessage:
+        return AIMessage(content="I cannot resolve the task within the allowed tool calls. Retry.")
@@ -0,0 +1,266 @@
+import asyncio, atexit, importlib, multiprocessing, os, threading, time
+from typing import Any, Dict, List, Optional, Set
+from langchain_core.tools import BaseTool
+from loguru import logger
+from core.utils.metrics import MetricsRegistry
+
+# Seconds between the checks for a timeout or a cancellation while a call runs
+POLL_INTERVAL = 0.05
+
+def _worker_main(conn, preload: List[str]) -> None:
+    """
+    Loop of a worker process: imports the tool modules once, then runs the calls it receives.
+    """
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.warning(f"[TOOL_POOL] Worker cannot preload {module}: {e!r}")
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if message is None:
+            return
+        tool, args, kwargs = message
+        try:
+            result = (True, type(tool)._process_run(tool, *args, **kwargs))
+        except Exception as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            conn.send((False, RuntimeError(f"Result of {tool.name} cannot be sent back: {e!r}")))
+
+class _Worker:
+    # A worker process and the parent end of its pipe
+
+    def __init__(self, context, preload: List[str]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, preload), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+class CallHandle:
+    # Lets a caller on another thread cancel a running call; the pool kills the worker running it
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+class ToolProcessPool:
+    """
+    Process-wide pool of warm worker processes for CPU-bound tools, so their work runs outside the event
+    loop and the GIL. Each worker runs one call at a time; a call that times out or is cancelled kills its
+    worker, which is replaced by a fresh one. Tool instances, inputs and outputs cross the process boundary
+    pickled, so they must be picklable.
+
+    The pool size comes from TOOL_PROCESS_WORKERS (default: number of CPUs) and the start method from
+    TOOL_PROCESS_START_METHOD (default: forkserver where available, otherwise spawn).
+
+    Attributes:
+        max_workers (int): Maximum number of worker processes.
+        preload (List[str]): Modules every worker imports when it starts.
+    """
+
+    _shared: Optional["ToolProcessPool"] = None
+    _lock = threading.Lock()
+
+    # Modules of the tools declared with the process execution mode, preloaded by the shared pool workers
+    tool_modules: Set[str] = set()
+
+    def __init__(self, max_workers: Optional[int] = None, preload: Optional[List[str]] = None, start_method: Optional[str] = None):
+        """
+        Initializes the pool. No process is started until start() or the first call.
+
+        Args:
+            max_workers (int, optional): Maximum number of worker processes. Default is TOOL_PROCESS_WORKERS or the CPUs.
+            preload (List[str], optional): Modules the workers import when they start.
+            start_method (str, optional): Multiprocessing start method. Default is TOOL_PROCESS_START_METHOD,
+                forkserver or spawn.
+        """
+        self.max_workers = max_workers or int(os.environ.get("TOOL_PROCESS_WORKERS", 0)) or os.cpu_count() or 1
+        self.preload = list(preload or [])
+        method = start_method or os.environ.get("TOOL_PROCESS_START_METHOD")
+        if method is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(method)
+        self._idle: List[_Worker] = []
+        self._workers = 0
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._workers_lock = threading.Lock()
+        self._closed = False
+        self.calls = 0
+        self.timeouts = 0
+        self.cancellations = 0
+        MetricsRegistry.shared().register("tool_process_pool", self.stats)
+
+    @classmethod
+    def shared(cls) -> "ToolProcessPool":
+        """
+        Returns the process-wide pool, preloading the modules of the process-mode tools.
+
+        Returns:
+            ToolProcessPool: The shared pool.
+        """
+        if cls._shared is None:
+            with cls._lock:
+                if cls._shared is None:
+                    cls._shared = cls(preload=sorted(cls.tool_modules))
+                    atexit.register(cls._shared.shutdown)
+        return cls._shared
+
+    def start(self) -> None:
+        """
+        Starts every worker ahead of the first call, so calls do not pay the process start and imports.
+        """
+        with self._workers_lock:
+            missing = self.max_workers - self._workers
+            self._workers += missing
+        started = [_Worker(self._context, self.preload) for _ in range(missing)]
+        with self._workers_lock:
+            self._idle.extend(started)
+        logger.debug(f"[TOOL_POOL] {missing} workers started ({self._context.get_start_method()}).")
+
+    def __acquire(self, deadline: Optional[float]) -> _Worker:
+        """
+        Takes an idle worker, starting one if the pool is not full, waiting for a free slot otherwise.
+        """
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No tool worker became free in time")
+        with self._workers_lock:
+            if self._idle:
+                return self._idle.pop()
+            self._workers += 1
+        try:
+            return _Worker(self._context, self.preload)
+        except Exception:
+            with self._workers_lock:
+                self._workers -= 1
+            self._slots.release()
+            raise
+
+    def __release(self, worker: _Worker, healthy: bool) -> None:
+        """
+        Returns a worker to the pool. A worker whose call did not finish cleanly is killed and replaced by a
+        warm one, so the next call does not pay the process start.
+        """
+        if not healthy:
+            worker.kill()
+            worker = None
+            if not self._closed:
+                try:
+                    worker = _Worker(self._context, self.preload)
+                except Exception as e:
+                    logger.warning(f"[TOOL_POOL] Cannot replace a killed worker: {e!r}")
+        with self._workers_lock:
+            if worker is not None and not self._closed:
+                self._idle.append(worker)
+            else:
+                self._workers -= 1
+        if worker is not None and self._closed:
+            worker.kill()
+        self._slots.release()
+
+    def run(self, tool: BaseTool, args: tuple = (), kwargs: Optional[dict] = None,
+            timeout: Optional[float] = None, handle: Optional[CallHandle] = None) -> Any:
+        """
+        Runs the original _run of a tool in a worker, blocking until it ends.
+
+        Args:
+            tool (BaseTool): The tool, pickled to the worker.
+            args (tuple, optional): Positional arguments of _run.
+            kwargs (dict, optional): Keyword arguments of _run.
+            timeout (float, optional): Seconds before the call is abandoned and its worker killed.
+            handle (CallHandle, optional): Handle to cancel the call from another thread.
+
+        Returns:
+            Any: The output of the tool.
+
+        Raises:
+            TimeoutError: If the call does not finish within timeout.
+            asyncio.CancelledError: If the call was cancelled through the handle.
+        """
+        if self._closed:
+            raise RuntimeError("The tool process pool is shut down")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        worker = self.__acquire(deadline)
+        healthy = False
+        self.calls += 1
+        try:
+            worker.conn.send((tool, args, kwargs or {}))
+            while not worker.conn.poll(POLL_INTERVAL):
+                if handle is not None and handle.cancelled.is_set():
+                    self.cancellations += 1
+                    raise asyncio.CancelledError(f"Tool {tool.name} cancelled")
+                if deadline is not None and time.monotonic() > deadline:
+                    self.timeouts += 1
+                    raise TimeoutError(f"Tool {tool.name} timed out after {timeout} seconds")
+                if not worker.process.is_alive():
+                    raise RuntimeError(f"Tool worker running {tool.name} died")
+            ok, result = worker.conn.recv()
+            healthy = True
+        except EOFError:
+            raise RuntimeError(f"Tool worker running {tool.name} died")
+        finally:
+            self.__release(worker, healthy)
+        if not ok:
+            raise result
+        return result
+
+    async def arun(self, tool: BaseTool, args: tuple = (), kwargs: Optional[dict] = None, timeout: Optional[float] = None) -> Any:
+        """
+        Runs the original _run of a tool in a worker without blocking the event loop. Cancelling the awaiting
+        task (e.g. by asyncio.wait_for) kills the worker running the call.
+
+        Args:
+            tool (BaseTool): The tool, pickled to the worker.
+            args (tuple, optional): Positional arguments of _run.
+            kwargs (dict, optional): Keyword arguments of _run.
+            timeout (float, optional): Seconds before the call is abandoned and its worker killed.
+
+        Returns:
+            Any: The output of the tool.
+        """
+        handle = CallHandle()
+        try:
+            return await asyncio.to_thread(self.run, tool, args, kwargs, timeout, handle)
+        except asyncio.CancelledError:
+            handle.cancel()
+            raise
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the pool counters.
+
+        Returns:
+            Dict[str, float]: Live and idle workers, calls, and calls that timed out or were cancelled.
+        """
+        return {"workers": self._workers, "idle": len(self._idle), "calls": self.calls,
+                "timeouts": self.timeouts, "cancellations": self.cancellations}
+
+    def shutdown(self) -> None:
+        """
+        Stops the idle workers; busy workers are killed when their call ends.
+        """
+        self._closed = True
+        with self._workers_lock:
+            idle, self._idle = self._idle, []
+            self._workers -= len(idle)
+        for worker in idle:
+            try:
+                worker.conn.send(None)
+                worker.process.join(timeout=1)
+            except Exception:
+                pass
+            if worker.process.is_alive():
+                worker.kill()
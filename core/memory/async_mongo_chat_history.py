@@ -0,0 +1,424 @@
+import os, json, asyncio, threading, weakref
+from typing import Dict, List, Optional, Sequence, Tuple
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_chunk_to_message, messages_from_dict
+from langchain_mongodb.chat_message_histories import (
+    DEFAULT_DBNAME,
+    DEFAULT_COLLECTION_NAME,
+    DEFAULT_SESSION_ID_KEY,
+    DEFAULT_HISTORY_KEY,
+)
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DESCENDING, MongoClient, errors
+from loguru import logger
+from core.memory.history_cache import SessionHistoryCache
+from core.utils.metrics import MetricsRegistry
+from core.memory.mongo_chat_history import (
+    DEFAULT_SUMMARY_COLLECTION_NAME,
+    CustomMongoDBChatMessageHistory,
+    message_upsert,
+    summary_message,
+    trim_messages,
+)
+from core.memory.mongo_client_pool import MongoClientPool
+from core.memory.write_behind_buffer import WriteBehindBuffer
+from core.utils.token_counter import count_message_tokens
+
+class AsyncMongoClientPool:
+    # A registry of pooled motor clients, one per connection string and event loop,
+    # since a motor client is bound to the loop it first runs on.
+
+    _clients: Dict[Tuple, AsyncIOMotorClient] = {}
+    # Indexes already ensured per client; clients of the same deployment compare equal and share an entry
+    _indexed: "weakref.WeakKeyDictionary[AsyncIOMotorClient, set]" = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls, connection_string: Optional[str] = None, **client_kwargs) -> AsyncIOMotorClient:
+        """
+        Returns the shared motor client for the connection string and the running loop.
+
+        Args:
+            connection_string (Optional[str]): MongoDB connection string. Defaults to MONGODB_CONN_STRING.
+            **client_kwargs: Extra client options, overriding the pool options from the environment.
+
+        Returns:
+            AsyncIOMotorClient: The pooled client.
+        """
+        connection_string = connection_string or os.environ["MONGODB_CONN_STRING"]
+        options = {**MongoClientPool.pool_options(), **client_kwargs}
+        loop = asyncio.get_running_loop()
+        key = (connection_string, tuple(sorted(options.items())), id(loop))
+
+        client = cls._clients.get(key)
+        if client is not None:
+            return client
+
+        with cls._lock:
+            client = cls._clients.get(key)
+            if client is None:
+                client = AsyncIOMotorClient(connection_string, io_loop=loop, **options)
+                cls._clients[key] = client
+                logger.debug(f"[MONGO_POOL] New async client created (maxPoolSize={options['maxPoolSize']}).")
+        return client
+
+    @classmethod
+    async def ensure_index(cls, collection, keys, **index_kwargs) -> None:
+        """
+        Creates an index on the collection only once per process and client.
+
+        Args:
+            collection (AsyncIOMotorCollection): The collection to index.
+            keys: Index keys, as accepted by create_index.
+            **index_kwargs: Additional keyword arguments for the index creation.
+        """
+        key = (collection.full_name, repr(keys), repr(sorted(index_kwargs.items())))
+        client = collection.database.client
+        if key not in cls._indexed.get(client, ()):
+            await collection.create_index(keys, **index_kwargs)
+            cls._indexed.setdefault(client, set()).add(key)
+
+    @classmethod
+    def close_all(cls) -> None:
+        """
+        Closes every pooled motor client.
+        """
+        with cls._lock:
+            clients = list(cls._clients.values())
+            cls._clients.clear()
+        for client in clients:
+            client.close()
+        cls._indexed.clear()
+
+class AsyncMongoDBChatMessageHistory(BaseChatMessageHistory):
+    """
+    Asyncio-native MongoDB chat message history built on motor, with the same storage layout as
+    CustomMongoDBChatMessageHistory. Writes can be buffered in a WriteBehindBuffer and flushed in batches.
+    The synchronous methods (messages, add_messages, clear) delegate to a CustomMongoDBChatMessageHistory with
+    the same settings and cache; they block, and their writes bypass the write-behind buffer.
+    """
+
+    def __init__(self,
+                 session_id: str,
+                 client: Optional[AsyncIOMotorClient] = None,
+                 connection_string: Optional[str] = None,
+                 database_name: str = DEFAULT_DBNAME,
+                 collection_name: str = DEFAULT_COLLECTION_NAME,
+                 *,
+                 session_id_key: str = DEFAULT_SESSION_ID_KEY,
+                 history_key: str = DEFAULT_HISTORY_KEY,
+                 history_size: Optional[int] = None,
+                 max_history_tokens: Optional[int] = None,
+                 token_model: Optional[str] = None,
+                 use_summary: bool = False,
+                 summary_collection_name: str = DEFAULT_SUMMARY_COLLECTION_NAME,
+                 cache: Optional[SessionHistoryCache] = None,
+                 write_behind: Optional[WriteBehindBuffer] = None,
+                 create_index: bool = True,
+                 sync_client: Optional[MongoClient] = None) -> None:
+        """
+        Initializes the history. Nothing is sent to MongoDB, and no client is resolved, until the first call.
+
+        Args:
+            session_id (str): Identifier of the session.
+            client (Optional[AsyncIOMotorClient]): Motor-compatible client, e.g. a local stand-in in tests.
+                Defaults to the pooled client from AsyncMongoClientPool.
+            connection_string (Optional[str]): Connection string, used only when no client is injected.
+            database_name (str): Name of the database to use.
+            collection_name (str): Name of the collection to use.
+            session_id_key (str): Name of the field that stores the session id.
+            history_key (str): Name of the field that stores the message.
+            history_size (Optional[int]): Maximum number of most recent messages to load. None loads all of them.
+            max_history_tokens (Optional[int]): Token budget for the loaded messages. None disables the budget.
+            token_model (Optional[str]): Model name used to pick the tiktoken encoding.
+            use_summary (bool): Whether to prepend the persisted rolling summary.
+            summary_collection_name (str): Name of the collection that stores the rolling summaries.
+            cache (Optional[SessionHistoryCache]): In-process cache of the loaded messages.
+            write_behind (Optional[WriteBehindBuffer]): Buffer for batched writes. None writes on every turn.
+            create_index (bool): Whether to ensure the indexes on first use (done once per process).
+            sync_client (Optional[MongoClient]): Client of the synchronous methods. Defaults to the pooled client
+                from MongoClientPool.
+        """
+        self.session_id = session_id
+        self.session_id_key = session_id_key
+        self.history_key = history_key
+        self.history_size = history_size
+        self.max_history_tokens = max_history_tokens
+        self.token_model = token_model
+        self.use_summary = use_summary
+        self.cache = cache
+        self.write_behind = write_behind
+        self.create_index = create_index
+
+        self.connection_string = connection_string
+        self.database_name = database_name
+        self.collection_name = collection_name
+        self.summary_collection_name = summary_collection_name
+        self.sync_client = sync_client
+        self.buffer_key = (f"{database_name}.{collection_name}", session_id)
+        self._client = client
+        self._sync_history: Optional[CustomMongoDBChatMessageHistory] = None
+
+    @property
+    def client(self) -> AsyncIOMotorClient:
+        # Resolved on first use, since the pooled client is bound to the running loop
+        if self._client is None:
+            self._client = AsyncMongoClientPool.get_client(self.connection_string)
+        return self._client
+
+    @property
+    def collection(self):
+        return self.client[self.database_name][self.collection_name]
+
+    @property
+    def summary_collection(self):
+        return self.client[self.database_name][self.summary_collection_name]
+
+    @property
+    def sync_history(self) -> CustomMongoDBChatMessageHistory:
+        """
+        The blocking history the synchronous methods delegate to, sharing the settings and the cache.
+
+        Returns:
+            CustomMongoDBChatMessageHistory: The synchronous history of the session.
+        """
+        if self._sync_history is None:
+            self._sync_history = CustomMongoDBChatMessageHistory(self.connection_string,
+                                                                 self.session_id,
+                                                                 self.database_name,
+                                                                 self.collection_name,
+                                                                 client=self.sync_client,
+                                                                 session_id_key=self.session_id_key,
+                                                                 history_key=self.history_key,
+                                                                 history_size=self.history_size,
+                                                                 max_history_tokens=self.max_history_tokens,
+                                                                 token_model=self.token_model,
+                                                                 use_summary=self.use_summary,
+                                                                 summary_collection_name=self.summary_collection_name,
+                                                                 cache=self.cache,
+                                                                 create_index=self.create_index)
+        return self._sync_history
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore
+        """
+        Retrieve the messages of the session with the blocking backend, including the buffered ones.
+
+        Returns:
+            List[BaseMessage]: The messages in chronological order.
+        """
+        messages = self.sync_history.messages
+        pending = [message for _, message in self.__pending()]
+        if pending:
+            messages = self.__trim(messages + pending)
+        return messages
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """
+        Append the messages of a turn with the blocking backend, bypassing the write-behind buffer.
+
+        Args:
+            messages (Sequence[BaseMessage]): The messages to add to the history.
+        """
+        self.sync_history.add_messages(messages)
+
+    def clear(self) -> None:
+        """
+        Clear the message history and its rolling summary with the blocking backend. Turns still in the
+        write-behind buffer are written afterwards; use aclear to flush them first.
+        """
+        self.sync_history.clear()
+
+    async def __ensure_indexes(self) -> None:
+        """
+        Ensures the same indexes as CustomMongoDBChatMessageHistory.
+        """
+        if not self.create_index:
+            return
+        await AsyncMongoClientPool.ensure_index(self.collection, self.session_id_key)
+        await AsyncMongoClientPool.ensure_index(self.collection, [(self.session_id_key, 1), ("_id", DESCENDING)])
+        if self.use_summary:
+            await AsyncMongoClientPool.ensure_index(self.summary_collection, self.session_id_key, unique=True)
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        """
+        Retrieve the messages of the session, including the ones still waiting in the write-behind buffer.
+
+        Returns:
+            List[BaseMessage]: The messages in chronological order.
+        """
+        messages = self.cache.get(self.session_id) if self.cache is not None else None
+        if messages is not None:
+            # A flushed turn leaves the buffer and reaches the cache in the same step, so nothing is seen twice
+            pending = [message for _, message in self.__pending()]
+        else:
+            # Taken before the load, so the messages are not cached if a write of the session raced it
+            token = self.cache.token() if self.cache is not None else None
+            before = self.__pending()
+            with MetricsRegistry.shared().timer("history_load", backend="motor"):
+                messages, loaded_ids = await self.__load_messages()
+            if self.cache is not None:
+                self.cache.put(self.session_id, messages, token=token)
+            # A turn flushed during the load is in the snapshot taken before it, and may also have been loaded
+            seen, pending = set(loaded_ids), []
+            for message_id, message in before + self.__pending():
+                if message_id is None or message_id not in seen:
+                    seen.add(message_id)
+                    pending.append(message)
+
+        if pending:
+            messages = trim_messages(messages + pending, self.history_size, self.max_history_tokens, self.token_model)
+        return messages
+
+    def __pending(self) -> List[Tuple[Optional[ObjectId], BaseMessage]]:
+        return self.write_behind.pending(self.buffer_key) if self.write_behind is not None else []
+
+    async def __load_messages(self) -> Tuple[List[BaseMessage], List[ObjectId]]:
+        """
+        Load the messages of the session from MongoDB, applying the window, budget and summary.
+
+        Returns:
+            Tuple[List[BaseMessage], List[ObjectId]]: The messages in chronological order, and the ids of the
+                stored ones.
+        """
+        await self.__ensure_indexes()
+        query = {self.session_id_key: self.session_id}
+        summary = None
+        try:
+            if self.use_summary:
+                summary = await self.summary_collection.find_one({self.session_id_key: self.session_id})
+                if summary is not None:
+                    query["_id"] = {"$gt": summary["LastMessageId"]}
+
+            if self.history_size is None and self.max_history_tokens is None:
+                cursor = self.collection.find(query, projection={self.history_key: True}).sort("_id", 1)
+                documents = [document async for document in cursor]
+                ids = [document["_id"] for document in documents]
+                messages = messages_from_dict([json.loads(document[self.history_key]) for document in documents])
+            else:
+                messages, ids = await self.__load_tail(query)
+        except errors.OperationFailure as err:
+            logger.error(err)
+            messages, ids = [], []
+
+        if summary is not None:
+            messages.insert(0, summary_message(summary["Summary"]))
+        return messages, ids
+
+    async def __load_tail(self, query: dict) -> Tuple[List[BaseMessage], List[ObjectId]]:
+        """
+        Loads the newest messages matching the query within the window and token budget.
+
+        Args:
+            query (dict): Filter on the message collection.
+
+        Returns:
+            Tuple[List[BaseMessage], List[ObjectId]]: The messages in chronological order and their ids.
+        """
+        # A limit of 0 means no limit for MongoDB
+        if self.history_size == 0:
+            return [], []
+        cursor = self.collection.find(query, projection={self.history_key: True}).sort("_id", DESCENDING)
+        if self.history_size is not None:
+            cursor = cursor.limit(self.history_size)
+
+        messages, ids, used_tokens = [], [], 0
+        async for document in cursor:
+            message = messages_from_dict([json.loads(document[self.history_key])])[0]
+            if self.max_history_tokens is not None:
+                used_tokens += count_message_tokens(message, self.token_model)
+                if used_tokens > self.max_history_tokens:
+                    break
+            messages.append(message)
+            ids.append(document["_id"])
+        await cursor.close()
+
+        messages.reverse()
+        ids.reverse()
+        return messages, ids
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """
+        Append the messages of a turn, through the write-behind buffer when there is one.
+
+        Args:
+            messages (Sequence[BaseMessage]): The messages to add to the history.
+        """
+        # With write-behind, this only times the enqueueing; the buffer times the bulk writes
+        with MetricsRegistry.shared().timer("history_write", backend="motor"):
+            await self.__write_messages(messages)
+
+    async def __write_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """
+        Writes the messages, or hands them to the write-behind buffer, and updates the cache.
+        """
+        # Streamed answers arrive as chunks; they are stored and cached as plain messages
+        messages = [message_chunk_to_message(message) for message in messages]
+        ids = [ObjectId() for _ in messages]
+        operations = [message_upsert(message, self.session_id, self.session_id_key, self.history_key, message_id)
+                      for message, message_id in zip(messages, ids)]
+        to_store = [(op, message, message_id) for op, message, message_id in zip(operations, messages, ids)
+                    if op is not None]
+        if not to_store:
+            return
+        await self.__ensure_indexes()
+
+        # Loads running until the write is through do not fill the cache; see SessionHistoryCache
+        if self.cache is not None:
+            self.cache.begin_write(self.session_id)
+        if self.write_behind is not None:
+            try:
+                await self.write_behind.put(self.collection,
+                                            self.buffer_key,
+                                            [op for op, _, _ in to_store],
+                                            [message for _, message, _ in to_store],
+                                            on_written=self.__write_through,
+                                            ids=[message_id for _, _, message_id in to_store])
+            except BaseException:
+                self.__write_through(None)
+                raise
+            return
+
+        inserted = None
+        try:
+            result = await self.collection.bulk_write([op for op, _, _ in to_store], ordered=False)
+            inserted = [to_store[index][1] for index in sorted(result.upserted_ids)]
+        except errors.BulkWriteError as err:
+            if any(e.get("code") != 11000 for e in err.details.get("writeErrors", [])):
+                logger.error(err)
+        except errors.WriteError as err:
+            logger.error(err)
+        finally:
+            self.__write_through(inserted)
+
+    def __write_through(self, inserted: Optional[List[BaseMessage]]) -> None:
+        """
+        Ends the write of a turn: appends the inserted messages to the cached session, under the cache lock.
+
+        Args:
+            inserted (Optional[List[BaseMessage]]): The messages actually inserted, or None if the write failed.
+        """
+        if self.cache is not None:
+            self.cache.end_write(self.session_id, inserted, trim=self.__trim)
+
+    def __trim(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        return trim_messages(messages, self.history_size, self.max_history_tokens, self.token_model)
+
+    async def aclear(self) -> None:
+        """
+        Clear the message history and its rolling summary, after flushing the buffered writes.
+        """
+        if self.write_behind is not None:
+            await self.write_behind.flush()
+        if self.cache is not None:
+            self.cache.begin_write(self.session_id)
+        try:
+            await self.collection.delete_many({self.session_id_key: self.session_id})
+            if self.use_summary:
+                await self.summary_collection.delete_many({self.session_id_key: self.session_id})
+        except errors.WriteError as err:
+            logger.error(err)
+        finally:
+            if self.cache is not None:
+                self.cache.end_write(self.session_id, None)
@@ -0,0 +1,213 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from langchain_core.messages import BaseMessage
+from loguru import logger
+from core.utils.metrics import MetricsRegistry
+
+# Approximate fixed cost of a message object besides its content, in bytes
+MESSAGE_OVERHEAD_BYTES = 256
+
+class SessionHistoryCache:
+    # A bounded, memory-capped LRU cache of deserialized session histories, keyed by session id.
+    # It is only coherent when this process is the single writer of the sessions it caches.
+    # Loads fill it with put(..., token=token()) taken before the load, so a fill that raced a write is dropped;
+    # writes are bracketed by begin_write and end_write, which appends the written messages under the lock.
+
+    def __init__(self, max_sessions: int = 1024, max_bytes: int = 64 * 1024 * 1024) -> None:
+        """
+        Initializes the SessionHistoryCache.
+
+        Args:
+            max_sessions (int): Maximum number of cached sessions. Default is 1024.
+            max_bytes (int): Approximate memory cap for all cached messages. Default is 64 MiB.
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[List[BaseMessage], int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # Logical clock of the writes: the sessions written most recently, and the newest write forgotten since
+        self._clock = 0
+        self._written: "OrderedDict[str, int]" = OrderedDict()
+        self._forgotten = 0
+        self._writing: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_fills = 0
+        MetricsRegistry.shared().register("history_cache", self.stats)
+
+    @staticmethod
+    def estimate_size(messages: List[BaseMessage]) -> int:
+        """
+        Estimates the memory used by a list of messages.
+
+        Args:
+            messages (List[BaseMessage]): The messages.
+
+        Returns:
+            int: Approximate size in bytes.
+        """
+        return sum(MESSAGE_OVERHEAD_BYTES + len(str(message.content)) for message in messages)
+
+    def get(self, session_id: str) -> Optional[List[BaseMessage]]:
+        """
+        Returns a copy of the cached messages of the session and marks it as recently used.
+
+        Args:
+            session_id (str): Identifier of the session.
+
+        Returns:
+            Optional[List[BaseMessage]]: The cached messages, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return list(entry[0])
+
+    def token(self) -> int:
+        """
+        Returns the current write clock, to pass to put when the messages loaded afterwards are cached.
+
+        Returns:
+            int: The token.
+        """
+        with self._lock:
+            return self._clock
+
+    def put(self, session_id: str, messages: List[BaseMessage], token: Optional[int] = None) -> None:
+        """
+        Stores the messages of the session, evicting the least recently used sessions if needed.
+
+        Args:
+            session_id (str): Identifier of the session.
+            messages (List[BaseMessage]): The messages to cache.
+            token (Optional[int]): Token taken before the messages were loaded. The messages are not stored if
+                the session was written or invalidated since, or is being written.
+        """
+        size = self.estimate_size(messages)
+        with self._lock:
+            if token is not None and (session_id in self._writing
+                                      or self._written.get(session_id, 0) > token
+                                      or self._forgotten > token):
+                self.stale_fills += 1
+                return
+            self.__store(session_id, list(messages), size)
+
+    def begin_write(self, session_id: str) -> None:
+        """
+        Marks the session as being written, so loads running meanwhile do not fill the cache.
+
+        Args:
+            session_id (str): Identifier of the session.
+        """
+        with self._lock:
+            self._writing[session_id] = self._writing.get(session_id, 0) + 1
+            self.__touch(session_id)
+
+    def end_write(self,
+                  session_id: str,
+                  inserted: Optional[List[BaseMessage]],
+                  trim: Optional[Callable[[List[BaseMessage]], List[BaseMessage]]] = None) -> None:
+        """
+        Ends a write started with begin_write, appending the inserted messages to the cached session.
+
+        Args:
+            session_id (str): Identifier of the session.
+            inserted (Optional[List[BaseMessage]]): The messages actually stored. None when the outcome of the
+                write is unknown, which drops the session from the cache.
+            trim (Optional[Callable]): Applies the window and budget to the appended messages.
+        """
+        with self._lock:
+            count = self._writing.pop(session_id, 1) - 1
+            if count:
+                self._writing[session_id] = count
+            self.__touch(session_id)
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            if inserted is None:
+                self.__drop(session_id)
+                return
+            if inserted:
+                messages = entry[0] + list(inserted)
+                messages = trim(messages) if trim is not None else messages
+                self.__store(session_id, messages, self.estimate_size(messages))
+
+    def __touch(self, session_id: str) -> None:
+        """
+        Records a write of the session on the clock, forgetting the oldest writes beyond max_sessions.
+        """
+        self._clock += 1
+        self._written[session_id] = self._clock
+        self._written.move_to_end(session_id)
+        while len(self._written) > self.max_sessions:
+            _, clock = self._written.popitem(last=False)
+            self._forgotten = max(self._forgotten, clock)
+
+    def __drop(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def __store(self, session_id: str, messages: List[BaseMessage], size: int) -> None:
+        """
+        Stores an entry under the lock and evicts the least recently used sessions beyond the limits.
+        """
+        self.__drop(session_id)
+        if size > self.max_bytes:
+            return
+
+        self._entries[session_id] = (messages, size)
+        self._size += size
+        while len(self._entries) > self.max_sessions or self._size > self.max_bytes:
+            evicted_id, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+            logger.debug(f"[HISTORY_CACHE] Session {evicted_id} evicted.")
+
+    def invalidate(self, session_id: str) -> None:
+        """
+        Removes the session from the cache.
+
+        Args:
+            session_id (str): Identifier of the session.
+        """
+        with self._lock:
+            self.__touch(session_id)
+            self.__drop(session_id)
+
+    def clear(self) -> None:
+        """
+        Removes every session from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._clock += 1
+            self._forgotten = self._clock
+            self._written.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the cache counters.
+
+        Returns:
+            Dict[str, float]: Hits, misses, evictions, dropped stale fills, hit rate, cached sessions and approximate bytes.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_fills": self.stale_fills,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "sessions": len(self._entries),
+                "bytes": self._size,
+            }
@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import get_buffer_string
+from langchain_core.prompts import ChatPromptTemplate
+from loguru import logger
+from core.executors.request_scheduler import RequestScheduler, ScheduledModel
+from core.memory.mongo_chat_history import CustomMongoDBChatMessageHistory
+
+# Sessions whose unsummarized message count is tracked; the least recently used are checked again
+MAX_TRACKED_SESSIONS = 10000
+
+# Prompt used to fold older messages into the running summary
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "Progressively summarize the conversation. Extend the current summary with the new lines, keeping "
+     "facts, names, decisions and open questions the assistant may need later. Return only the new summary."),
+    ("human", "Current summary:\n{summary}\n\nNew lines of conversation:\n{new_lines}"),
+])
+
+class HistoryCompactor:
+    # A class that folds the older messages of long sessions into a persisted rolling summary,
+    # in background threads off the request path. It counts the messages stored per session since the
+    # last check, so MongoDB is only read when a session may have crossed the threshold.
+
+    def __init__(self,
+                 llm: BaseChatModel,
+                 threshold: int = 40,
+                 keep_last: int = 10,
+                 max_workers: int = 2,
+                 scheduler: RequestScheduler = None) -> None:
+        """
+        Initializes the HistoryCompactor.
+
+        Args:
+            llm (BaseChatModel): The language model used to write the summaries.
+            threshold (int): Number of unsummarized messages above which a session is compacted. Default is 40.
+            keep_last (int): Number of recent messages kept verbatim after compaction. Default is 10.
+            max_workers (int): Maximum number of sessions compacted at the same time. Default is 2.
+            scheduler (RequestScheduler): Budgets of the summary calls, shared with the agents. Defaults to
+                RequestScheduler.shared().
+        """
+        if keep_last >= threshold:
+            raise ValueError("keep_last must be lower than threshold")
+
+        self.llm = llm
+        self.model = ScheduledModel(llm, scheduler or RequestScheduler.shared())
+        self.threshold = threshold
+        self.keep_last = keep_last
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._in_flight: set = set()
+        # Estimated unsummarized messages per session; a session missing here is checked on its next turn
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def schedule(self,
+                 session_id: str,
+                 get_history: Callable[[str], CustomMongoDBChatMessageHistory],
+                 added: int = 2) -> Optional[Future]:
+        """
+        Counts the messages stored by a turn and schedules the compaction of the session in the background
+        once it may have crossed the threshold. A session is never compacted twice at once.
+
+        Args:
+            session_id (str): Identifier of the session.
+            get_history (Callable): Factory returning the history of a session id.
+            added (int): Messages the turn stored. Default is 2, the input and the answer.
+
+        Returns:
+            Optional[Future]: The future of the compaction, or None if none was scheduled.
+        """
+        with self._lock:
+            count = self._counts.get(session_id)
+            if count is not None:
+                self._counts[session_id] = count = count + added
+                self._counts.move_to_end(session_id)
+                if count <= self.threshold:
+                    return None
+            if session_id in self._in_flight:
+                return None
+            self._in_flight.add(session_id)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="history-compactor")
+
+        try:
+            return self._pool.submit(self._compact_session, session_id, get_history)
+        except Exception:
+            self._release(session_id)
+            raise
+
+    def _compact_session(self, session_id: str, get_history: Callable[[str], CustomMongoDBChatMessageHistory]) -> bool:
+        """
+        Builds the history of the session in the worker, so its index creation stays off the caller's event loop
+        and its errors do not reach the caller, then compacts it. The session is released in every case.
+        """
+        try:
+            return self.compact(get_history(session_id))
+        except Exception as e:
+            logger.error(f"[HISTORY_COMPACTOR] Error opening the history of session {session_id}: {e!r}")
+            return False
+        finally:
+            self._release(session_id)
+
+    def compact(self, history: CustomMongoDBChatMessageHistory) -> bool:
+        """
+        Folds the unsummarized messages of the session, except the most recent ones, into the summary.
+
+        Args:
+            history (CustomMongoDBChatMessageHistory): The history of the session.
+
+        Returns:
+            bool: True if the summary was updated.
+        """
+        try:
+            pending = history.unsummarized_messages()
+            if len(pending) <= self.threshold:
+                self.__count(history.session_id, len(pending))
+                return False
+
+            to_fold = pending[:-self.keep_last]
+            summary = history.load_summary()
+            # Through the scheduler, so the summaries share the model budgets with the agents
+            response = self.model.invoke(SUMMARY_PROMPT.invoke({
+                "summary": summary["Summary"] if summary else "",
+                "new_lines": get_buffer_string([message for _, message in to_fold]),
+            }))
+            history.save_summary(response.content, last_message_id=to_fold[-1][0])
+            self.__count(history.session_id, len(pending) - len(to_fold))
+            logger.debug(f"[HISTORY_COMPACTOR] {len(to_fold)} messages folded for session {history.session_id}.")
+            return True
+        except Exception as e:
+            logger.error(f"[HISTORY_COMPACTOR] Error compacting session {history.session_id}: {e}")
+            self.__count(history.session_id, None)
+            return False
+
+    def __count(self, session_id: str, count: Optional[int]) -> None:
+        """
+        Records the unsummarized messages of a session after a check. None forgets it, so it is checked again.
+        """
+        with self._lock:
+            if count is None:
+                self._counts.pop(session_id, None)
+                return
+            self._counts[session_id] = count
+            self._counts.move_to_end(session_id)
+            while len(self._counts) > MAX_TRACKED_SESSIONS:
+                self._counts.popitem(last=False)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the background workers.
+
+        Args:
+            wait (bool): Whether to wait for the running compactions to finish. Default is True.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+    def _release(self, session_id: str) -> None:
+        with self._lock:
+            self._in_flight.discard(session_id)
@@ -0,0 +1,383 @@
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+from bson import ObjectId
+from langchain_core.messages import BaseMessage, SystemMessage, message_chunk_to_message, message_to_dict, messages_from_dict
+from langchain_mongodb import MongoDBChatMessageHistory
+from langchain_mongodb.chat_message_histories import (
+    DEFAULT_DBNAME,
+    DEFAULT_COLLECTION_NAME,
+    DEFAULT_SESSION_ID_KEY,
+    DEFAULT_HISTORY_KEY,
+)
+from pymongo import DESCENDING, MongoClient, UpdateOne, errors
+from loguru import logger
+from core.memory.mongo_client_pool import MongoClientPool
+from core.memory.history_cache import SessionHistoryCache
+from core.utils.token_counter import count_message_tokens
+from core.utils.metrics import MetricsRegistry
+
+DEFAULT_SUMMARY_COLLECTION_NAME = "message_summary"
+SUMMARY_MESSAGE_ID = "conversation-summary"
+
+def message_upsert(message: BaseMessage,
+                   session_id: str,
+                   session_id_key: str = DEFAULT_SESSION_ID_KEY,
+                   history_key: str = DEFAULT_HISTORY_KEY,
+                   message_id: Optional[ObjectId] = None) -> Optional[UpdateOne]:
+    """
+    Builds the idempotent upsert for a message, or None if the message must not be stored.
+
+    The upsert is keyed on a message id generated here, not on the content, so a message the user repeats is
+    stored again while a retried write of the same operation is not. The ids are ObjectIds generated in turn
+    order, so the history stays chronological with unordered bulk writes.
+
+    Args:
+        message (BaseMessage): The message to store.
+        session_id (str): Identifier of the session.
+        session_id_key (str): Name of the field that stores the session id.
+        history_key (str): Name of the field that stores the message.
+        message_id (Optional[ObjectId]): Id of the stored message. Default is a new ObjectId.
+
+    Returns:
+        Optional[UpdateOne]: Upsert keyed on the session id and the message id.
+    """
+    message_dict = message_to_dict(message)
+
+    # Tool calls and tool responses are not saved
+    if message_dict["data"]["additional_kwargs"].get("tool_calls", None) is not None:
+        return None
+    if message_dict["type"] == "tool":
+        return None
+
+    return UpdateOne(
+        {"_id": message_id or ObjectId(), session_id_key: session_id},
+        {"$setOnInsert": {history_key: json.dumps(message_dict)}},
+        upsert=True,
+    )
+
+def trim_messages(messages: List[BaseMessage],
+                  history_size: Optional[int] = None,
+                  max_history_tokens: Optional[int] = None,
+                  token_model: Optional[str] = None) -> List[BaseMessage]:
+    """
+    Applies the window and token budget to messages in memory, keeping the summary message if present.
+
+    Args:
+        messages (List[BaseMessage]): The messages in chronological order.
+        history_size (Optional[int]): Maximum number of most recent messages.
+        max_history_tokens (Optional[int]): Token budget for the messages.
+        token_model (Optional[str]): Model name used to pick the tiktoken encoding.
+
+    Returns:
+        List[BaseMessage]: The newest messages that fit the window and budget.
+    """
+    head = messages[:1] if messages and messages[0].id == SUMMARY_MESSAGE_ID else []
+    tail = messages[len(head):]
+    if history_size is not None:
+        tail = tail[-history_size:] if history_size else []
+    if max_history_tokens is not None:
+        kept, used_tokens = [], 0
+        for message in reversed(tail):
+            used_tokens += count_message_tokens(message, token_model)
+            if used_tokens > max_history_tokens:
+                break
+            kept.append(message)
+        tail = kept[::-1]
+    return head + tail
+
+def summary_message(summary: str) -> SystemMessage:
+    """
+    Builds the system message that carries the rolling summary into the prompt.
+
+    Args:
+        summary (str): The summary text.
+
+    Returns:
+        SystemMessage: The summary message.
+    """
+    return SystemMessage(content=f"Summary of the earlier conversation:\n{summary}", id=SUMMARY_MESSAGE_ID)
+
+class CustomMongoDBChatMessageHistory(MongoDBChatMessageHistory):
+    """ Extension of the MongoDBChatMessageHistory class """
+
+    def __init__(self,
+                 connection_string: Optional[str],
+                 session_id: str,
+                 database_name: str = DEFAULT_DBNAME,
+                 collection_name: str = DEFAULT_COLLECTION_NAME,
+                 *,
+                 client: Optional[MongoClient] = None,
+                 session_id_key: str = DEFAULT_SESSION_ID_KEY,
+                 history_key: str = DEFAULT_HISTORY_KEY,
+                 history_size: Optional[int] = None,
+                 max_history_tokens: Optional[int] = None,
+                 token_model: Optional[str] = None,
+                 use_summary: bool = False,
+                 summary_collection_name: str = DEFAULT_SUMMARY_COLLECTION_NAME,
+                 cache: Optional[SessionHistoryCache] = None,
+                 create_index: bool = True,
+                 index_kwargs: Optional[Dict] = None) -> None:
+        """
+        Initializes the history on top of a shared, pooled MongoClient instead of opening a new one.
+
+        Args:
+            connection_string (Optional[str]): Connection string, used only when no client is injected.
+            session_id (str): Identifier of the session.
+            database_name (str): Name of the database to use.
+            collection_name (str): Name of the collection to use.
+            client (Optional[MongoClient]): Client to use. Defaults to the pooled client from MongoClientPool.
+            session_id_key (str): Name of the field that stores the session id.
+            history_key (str): Name of the field that stores the message.
+            history_size (Optional[int]): Maximum number of most recent messages to load. None loads all of them.
+            max_history_tokens (Optional[int]): Token budget for the loaded messages, counted with tiktoken.
+                None disables the budget.
+            token_model (Optional[str]): Model name used to pick the tiktoken encoding.
+            use_summary (bool): Whether to prepend the persisted rolling summary and load only the messages
+                that were not folded into it.
+            summary_collection_name (str): Name of the collection that stores the rolling summaries.
+            cache (Optional[SessionHistoryCache]): In-process cache of the loaded messages, written through on
+                add_messages and invalidated on clear. The cache must not be shared by histories with different
+                window, budget or summary settings.
+            create_index (bool): Whether to ensure the session id indexes (done once per process).
+            index_kwargs (Optional[Dict]): Additional keyword arguments for the index creation.
+        """
+        self.connection_string = connection_string
+        self.session_id = session_id
+        self.database_name = database_name
+        self.collection_name = collection_name
+        self.session_id_key = session_id_key
+        self.history_key = history_key
+        self.history_size = history_size
+        self.max_history_tokens = max_history_tokens
+        self.token_model = token_model
+        self.use_summary = use_summary
+        self.cache = cache
+
+        self.client: MongoClient = client or MongoClientPool.get_client(connection_string)
+        self.db = self.client[database_name]
+        self.collection = self.db[collection_name]
+        self.summary_collection = self.db[summary_collection_name]
+
+        if create_index:
+            MongoClientPool.ensure_index(self.collection, self.session_id_key, **(index_kwargs or {}))
+            # Serves the windowed tail query: newest messages of a session first
+            MongoClientPool.ensure_index(self.collection, [(self.session_id_key, 1), ("_id", DESCENDING)])
+            if use_summary:
+                MongoClientPool.ensure_index(self.summary_collection, self.session_id_key, unique=True)
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore
+        """
+        Retrieve the messages of the session, from the cache when it holds them.
+
+        Returns:
+            List[BaseMessage]: The messages in chronological order.
+        """
+        messages = self.cache.get(self.session_id) if self.cache is not None else None
+        if messages is None:
+            # Taken before the load, so the messages are not cached if a write of the session raced it
+            token = self.cache.token() if self.cache is not None else None
+            with MetricsRegistry.shared().timer("history_load", backend="mongo"):
+                messages = self.__load_messages()
+            if self.cache is not None:
+                self.cache.put(self.session_id, messages, token=token)
+        return messages
+
+    def __load_messages(self) -> List[BaseMessage]:
+        """
+        Load the messages of the session from MongoDB. When a window or token budget is set, only the tail of the
+        history is fetched, newest first, and loading stops as soon as the budget is reached. When the rolling
+        summary is enabled, it is prepended as a system message and replaces the messages folded into it.
+
+        Returns:
+            List[BaseMessage]: The messages in chronological order.
+        """
+        summary = self.load_summary() if self.use_summary else None
+        if summary is None and self.history_size is None and self.max_history_tokens is None:
+            return super().messages
+
+        query = {self.session_id_key: self.session_id}
+        if summary is not None:
+            query["_id"] = {"$gt": summary["LastMessageId"]}
+
+        try:
+            if self.history_size is None and self.max_history_tokens is None:
+                cursor = self.collection.find(query, projection={self.history_key: True}).sort("_id", 1)
+                messages = messages_from_dict([json.loads(document[self.history_key]) for document in cursor])
+            else:
+                messages = self.__load_tail(query)
+        except errors.OperationFailure as err:
+            logger.error(err)
+            messages = []
+
+        if summary is not None:
+            messages.insert(0, summary_message(summary["Summary"]))
+        return messages
+
+    def __load_tail(self, query: dict) -> List[BaseMessage]:
+        """
+        Loads the newest messages matching the query within the window and token budget.
+
+        Args:
+            query (dict): Filter on the message collection.
+
+        Returns:
+            List[BaseMessage]: The messages in chronological order.
+        """
+        # A limit of 0 means no limit for MongoDB
+        if self.history_size == 0:
+            return []
+        cursor = self.collection.find(query, projection={self.history_key: True, "_id": False}).sort("_id", DESCENDING)
+        if self.history_size is not None:
+            cursor = cursor.limit(self.history_size)
+        else:
+            cursor = cursor.batch_size(64)
+
+        messages, used_tokens = [], 0
+        for document in cursor:
+            message = messages_from_dict([json.loads(document[self.history_key])])[0]
+            if self.max_history_tokens is not None:
+                used_tokens += count_message_tokens(message, self.token_model)
+                if used_tokens > self.max_history_tokens:
+                    break
+            messages.append(message)
+        cursor.close()
+
+        messages.reverse()
+        return messages
+
+    def load_summary(self) -> Optional[dict]:
+        """
+        Retrieve the rolling summary document of the session.
+
+        Returns:
+            Optional[dict]: Document with the Summary text and the LastMessageId folded into it, if any.
+        """
+        try:
+            return self.summary_collection.find_one({self.session_id_key: self.session_id})
+        except errors.OperationFailure as err:
+            logger.error(err)
+            return None
+
+    def save_summary(self, summary: str, last_message_id: ObjectId) -> None:
+        """
+        Store the rolling summary of the session.
+
+        Args:
+            summary (str): The summary text.
+            last_message_id (ObjectId): Id of the newest message folded into the summary.
+        """
+        try:
+            self.summary_collection.update_one(
+                {self.session_id_key: self.session_id},
+                {"$set": {
+                    "Summary": summary,
+                    "LastMessageId": last_message_id,
+                    "UpdatedAt": datetime.now(timezone.utc),
+                }},
+                upsert=True,
+            )
+        except errors.WriteError as err:
+            logger.error(err)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(self.session_id)
+
+    def unsummarized_messages(self) -> List[Tuple[ObjectId, BaseMessage]]:
+        """
+        Retrieve the messages that are not folded into the rolling summary yet, with their ids.
+
+        Returns:
+            List[Tuple[ObjectId, BaseMessage]]: Pairs of message id and message, in chronological order.
+        """
+        query = {self.session_id_key: self.session_id}
+        summary = self.load_summary()
+        if summary is not None:
+            query["_id"] = {"$gt": summary["LastMessageId"]}
+        cursor = self.collection.find(query, projection={self.history_key: True}).sort("_id", 1)
+        return [(document["_id"], messages_from_dict([json.loads(document[self.history_key])])[0])
+                for document in cursor]
+
+    def add_message(self, message: BaseMessage) -> None:
+        """
+        Append the message to the record in MongoDB, skipping messages already stored for the session.
+        
+        Args:
+            message (BaseMessage): The message to add to the history.
+        """
+        self.add_messages([message])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """
+        Append the messages of a turn to the record in MongoDB with a single bulk write.
+
+        Args:
+            messages (Sequence[BaseMessage]): The messages to add to the history.
+        """
+        with MetricsRegistry.shared().timer("history_write", backend="mongo"):
+            self.__write_messages(messages)
+
+    def __write_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """
+        Writes the messages with an unordered bulk write and updates the cache.
+        """
+        # Streamed answers arrive as chunks; they are stored and cached as plain messages
+        messages = [message_chunk_to_message(message) for message in messages]
+        operations = [message_upsert(message, self.session_id, self.session_id_key, self.history_key)
+                      for message in messages]
+        to_store = [(op, message) for op, message in zip(operations, messages) if op is not None]
+        if not to_store:
+            return
+        if self.cache is None:
+            self.__bulk_write(to_store)
+            return
+
+        # Write-through: only the messages actually inserted (not already stored by a retry) reach the cached
+        # session, appended under the cache lock; loads running meanwhile do not fill the cache
+        self.cache.begin_write(self.session_id)
+        inserted = None
+        try:
+            inserted = self.__bulk_write(to_store)
+        finally:
+            self.cache.end_write(self.session_id, inserted, trim=self.__trim)
+
+    def __bulk_write(self, to_store: List[Tuple[UpdateOne, BaseMessage]]) -> Optional[List[BaseMessage]]:
+        """
+        Runs the unordered bulk write of a turn.
+
+        Returns:
+            Optional[List[BaseMessage]]: The messages inserted, or None if the write failed.
+        """
+        try:
+            # Unordered, so a failed write does not drop the rest of the turn; the ids keep the turn order
+            result = self.collection.bulk_write([op for op, _ in to_store], ordered=False)
+        except errors.BulkWriteError as err:
+            # A retried write of an already stored message hits the _id index, which is expected
+            if any(e.get("code") != 11000 for e in err.details.get("writeErrors", [])):
+                logger.error(err)
+            return None
+        except errors.WriteError as err:
+            logger.error(err)
+            return None
+        return [to_store[index][1] for index in sorted(result.upserted_ids)]
+
+    def __trim(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        return trim_messages(messages, self.history_size, self.max_history_tokens, self.token_model)
+
+    def clear(self) -> None:
+        """
+        Clear the message history and its rolling summary.
+        """
+        if self.cache is not None:
+            self.cache.begin_write(self.session_id)
+        try:
+            super().clear()
+            if self.use_summary:
+                try:
+                    self.summary_collection.delete_many({self.session_id_key: self.session_id})
+                except errors.WriteError as err:
+                    logger.error(err)
+        finally:
+            if self.cache is not None:
+                self.cache.end_write(self.session_id, None)
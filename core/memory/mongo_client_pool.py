@@ -0,0 +1,94 @@
+import os, atexit, threading
+from typing import Dict, Optional, Tuple
+from pymongo import MongoClient
+from loguru import logger
+
+class MongoClientPool:
+    # A process-wide registry of pooled MongoClient instances, shared by every session and agent.
+    # pymongo keeps its own connection pool inside each MongoClient, so reusing a single client
+    # per connection string avoids a new TCP/TLS/auth handshake on every turn.
+
+    _clients: Dict[Tuple, MongoClient] = {}
+    _indexed: set = set()
+    _lock = threading.Lock()
+    _atexit_registered: bool = False
+
+    @staticmethod
+    def pool_options() -> dict:
+        """
+        Builds the pool options for new clients from the environment.
+
+        Returns:
+            dict: Keyword arguments for MongoClient (pool size limits, idle and wait timeouts).
+        """
+        return {
+            "maxPoolSize": int(os.environ.get("MONGODB_MAX_POOL_SIZE", 100)),
+            "minPoolSize": int(os.environ.get("MONGODB_MIN_POOL_SIZE", 0)),
+            "maxIdleTimeMS": int(os.environ.get("MONGODB_MAX_IDLE_TIME_MS", 300000)),
+            "waitQueueTimeoutMS": int(os.environ.get("MONGODB_WAIT_QUEUE_TIMEOUT_MS", 10000)),
+        }
+
+    @classmethod
+    def get_client(cls, connection_string: Optional[str] = None, **client_kwargs) -> MongoClient:
+        """
+        Returns the shared client for the connection string, creating it on first use.
+
+        Args:
+            connection_string (Optional[str]): MongoDB connection string. Defaults to MONGODB_CONN_STRING.
+            **client_kwargs: Extra MongoClient options, overriding the pool options from the environment.
+
+        Returns:
+            MongoClient: The pooled client for the given connection string and options.
+        """
+        connection_string = connection_string or os.environ["MONGODB_CONN_STRING"]
+        options = {**cls.pool_options(), **client_kwargs}
+        key = (connection_string, tuple(sorted(options.items())))
+
+        client = cls._clients.get(key)
+        if client is not None:
+            return client
+
+        with cls._lock:
+            client = cls._clients.get(key)
+            if client is None:
+                client = MongoClient(connection_string, **options)
+                cls._clients[key] = client
+                logger.debug(f"[MONGO_POOL] New client created (maxPoolSize={options['maxPoolSize']}).")
+                if not cls._atexit_registered:
+                    atexit.register(cls.close_all)
+                    cls._atexit_registered = True
+        return client
+
+    @classmethod
+    def ensure_index(cls, collection, keys, **index_kwargs) -> None:
+        """
+        Creates an index on the collection only once per process.
+
+        Args:
+            collection (Collection): The collection to index.
+            keys: Index keys, as accepted by Collection.create_index.
+            **index_kwargs: Additional keyword arguments for the index creation.
+        """
+        key = (id(collection.database.client), collection.full_name, repr(keys), repr(sorted(index_kwargs.items())))
+        if key in cls._indexed:
+            return
+        with cls._lock:
+            if key not in cls._indexed:
+                collection.create_index(keys, **index_kwargs)
+                cls._indexed.add(key)
+
+    @classmethod
+    def close_all(cls) -> None:
+        """
+        Closes every pooled client. Called automatically at interpreter shutdown.
+        """
+        with cls._lock:
+            for client in cls._clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    logger.debug(f"[MONGO_POOL] Error closing client: {e}")
+            if cls._clients:
+                logger.debug(f"[MONGO_POOL] {len(cls._clients)} clients closed.")
+            cls._clients.clear()
+            cls._indexed.clear()
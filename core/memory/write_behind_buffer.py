@@ -0,0 +1,188 @@
+import asyncio
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+from langchain_core.messages import BaseMessage
+from pymongo import UpdateOne, errors
+from loguru import logger
+
+class WriteBehindBuffer:
+    # A bounded asyncio queue of history writes, flushed to MongoDB in batches by a background task.
+    # Writes still in the buffer are visible through pending() so sessions read their own writes.
+    # A turn leaves pending() in the same step its on_written callback runs, after its bulk write.
+
+    def __init__(self,
+                 max_pending: int = 10000,
+                 batch_size: int = 256,
+                 flush_interval: float = 0.05,
+                 max_attempts: int = 3) -> None:
+        """
+        Initializes the WriteBehindBuffer.
+
+        Args:
+            max_pending (int): Maximum number of buffered turns. Producers wait when the buffer is full. Default is 10000.
+            batch_size (int): Maximum number of turns flushed in one bulk write per collection. Default is 256.
+            flush_interval (float): Seconds to wait for more turns before flushing a batch. Default is 0.05.
+            max_attempts (int): Attempts per batch before the writes are dropped and logged. Default is 3.
+        """
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._pending: Dict[Hashable, Deque[List[Tuple[Any, BaseMessage]]]] = defaultdict(deque)
+
+    async def put(self,
+                  collection,
+                  key: Hashable,
+                  operations: List[UpdateOne],
+                  messages: List[BaseMessage],
+                  on_written: Callable[[Optional[List[BaseMessage]]], None] = None,
+                  ids: Optional[List[Any]] = None) -> None:
+        """
+        Buffers the writes of a turn.
+
+        Args:
+            collection (AsyncIOMotorCollection): The collection to write to.
+            key (Hashable): Key of the session, used to expose the pending messages.
+            operations (List[UpdateOne]): The upserts of the turn.
+            messages (List[BaseMessage]): The messages matching each operation.
+            on_written (Callable, optional): Called with the messages actually inserted once the turn is flushed,
+                or with None if its writes were dropped.
+            ids (List[Any], optional): The _id of each operation, exposed with the pending messages.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self.__run())
+
+        self._pending[key].append(list(zip(ids or [None] * len(messages), messages)))
+        await self._queue.put((collection, key, operations, messages, on_written))
+
+    def pending(self, key: Hashable) -> List[Tuple[Any, BaseMessage]]:
+        """
+        Returns the buffered messages of a session that are not released yet, with their ids. A message may
+        already be in MongoDB while its batch is being written, so readers merging both deduplicate on the id.
+
+        Args:
+            key (Hashable): Key of the session.
+
+        Returns:
+            List[Tuple[Any, BaseMessage]]: Pairs of id (None if not given) and message, in order.
+        """
+        return [item for turn in self._pending.get(key, ()) for item in turn]
+
+    async def flush(self) -> None:
+        """
+        Waits until every buffered turn is written.
+        """
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """
+        Flushes the buffer and stops the background task.
+        """
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def __run(self) -> None:
+        """
+        Drains the queue in batches of up to batch_size turns or flush_interval seconds.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self.__write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def __write(self, batch: List[Tuple]) -> None:
+        """
+        Writes a batch with one bulk write per collection and releases the pending messages. Every turn is
+        released, with the messages it inserted, or None if its writes were dropped.
+
+        Args:
+            batch (List[Tuple]): The buffered turns.
+        """
+        by_collection: Dict[str, List[Tuple]] = defaultdict(list)
+        for item in batch:
+            by_collection[item[0].full_name].append(item)
+
+        for items in by_collection.values():
+            collection = items[0][0]
+            operations = [op for item in items for op in item[2]]
+            try:
+                upserted = await self.__bulk_write(collection, operations)
+            except Exception as e:
+                logger.error(f"[WRITE_BEHIND] Unexpected error flushing {len(items)} turns: {e}")
+                upserted = None
+
+            offset = 0
+            for _, key, item_operations, messages, on_written in items:
+                turns = self._pending.get(key)
+                if turns:
+                    turns.popleft()
+                    if not turns:
+                        del self._pending[key]
+                if on_written is not None:
+                    try:
+                        on_written(None if upserted is None else
+                                   [messages[index - offset] for index in sorted(upserted)
+                                    if offset <= index < offset + len(item_operations)])
+                    except Exception as e:
+                        logger.error(f"[WRITE_BEHIND] Callback of a flushed turn failed: {e}")
+                offset += len(item_operations)
+
+    async def __bulk_write(self, collection, operations: List[UpdateOne]) -> Optional[set]:
+        """
+        Runs the bulk write with retries. A failed operation does not drop the ones after it, since a batch
+        mixes the turns of several sessions.
+
+        Args:
+            collection (AsyncIOMotorCollection): The collection to write to.
+            operations (List[UpdateOne]): The upserts.
+
+        Returns:
+            Optional[set]: Indexes of the inserted operations, or None if the writes were dropped.
+        """
+        upserted, start, attempt = set(), 0, 1
+        while start < len(operations):
+            try:
+                result = await collection.bulk_write(operations[start:], ordered=True)
+                upserted.update(start + index for index in result.upserted_ids)
+                break
+            except errors.BulkWriteError as err:
+                upserted.update(start + item["index"] for item in err.details.get("upserted", []))
+                write_errors = err.details.get("writeErrors", [])
+                if not write_errors:
+                    break
+                # Operations already applied by a retried attempt are expected; anything else is reported
+                if write_errors[0].get("code") != 11000:
+                    logger.error(f"[WRITE_BEHIND] {write_errors[0].get('errmsg')}")
+                start += write_errors[0]["index"] + 1
+            except errors.PyMongoError as err:
+                if attempt == self.max_attempts:
+                    logger.error(f"[WRITE_BEHIND] {len(operations) - start} writes dropped after {attempt} attempts: {err}")
+                    return None
+                await asyncio.sleep(0.1 * 2 ** attempt)
+                attempt += 1
+        return upserted
@@ -0,0 +1,264 @@
+import asyncio, json, signal, sys, threading
+from typing import Dict, Optional
+from langchain_core.messages import BaseMessage, HumanMessage
+from loguru import logger
+from core.executors.runnable_executor import RunnableExecutor
+from core.utils.metrics import MetricsRegistry
+
+class AgentServer:
+    """
+    Serves an agent executor to many sessions concurrently on one event loop.
+
+    Turns of the same session run in arrival order behind a per-session lock, at most max_concurrency turns
+    call the executor at the same time, and at most max_pending turns are admitted: the JSONL reader stops
+    reading and the HTTP endpoint answers 503 while the server is full. Shutdown stops admitting turns and
+    waits for the admitted ones before closing the executor and the pooled clients.
+
+    Attributes:
+        executor (RunnableExecutor): The executor serving the turns.
+        max_concurrency (int): Maximum number of turns calling the executor at the same time.
+        max_pending (int): Maximum number of admitted turns, waiting or running.
+        shutdown_timeout (float): Seconds to wait for the admitted turns on shutdown.
+    """
+
+    def __init__(self,
+                 executor: RunnableExecutor,
+                 max_concurrency: int = 32,
+                 max_pending: int = 1024,
+                 shutdown_timeout: float = 30.0):
+        """
+        Initializes the AgentServer.
+
+        Args:
+            executor (RunnableExecutor): The executor serving the turns.
+            max_concurrency (int, optional): Maximum number of turns calling the executor at once. Default is 32.
+            max_pending (int, optional): Maximum number of admitted turns. Default is 1024.
+            shutdown_timeout (float, optional): Seconds to wait for the admitted turns on shutdown. Default is 30.
+        """
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.shutdown_timeout = shutdown_timeout
+        self._concurrency = asyncio.Semaphore(max_concurrency)
+        self._admission = asyncio.Semaphore(max_pending)
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._session_waiters: Dict[str, int] = {}
+        self._tasks: set = set()
+        self._stopping = asyncio.Event()
+        self.pending = 0
+        self.closing = False
+
+    async def __admit(self) -> None:
+        await self._admission.acquire()
+        self.pending += 1
+
+    def __release(self) -> None:
+        self.pending -= 1
+        self._admission.release()
+
+    async def handle(self, session_id: str, content: str) -> BaseMessage:
+        """
+        Runs a turn, waiting for admission when the server is full.
+
+        Args:
+            session_id (str): Identifier of the session.
+            content (str): The user message.
+
+        Returns:
+            BaseMessage: The agent answer.
+        """
+        if self.closing:
+            raise RuntimeError("The server is shutting down")
+        await self.__admit()
+        try:
+            return await self.__process(session_id, content)
+        finally:
+            self.__release()
+
+    async def __process(self, session_id: str, content: str) -> BaseMessage:
+        """
+        Runs an admitted turn behind the session lock and the global concurrency limit.
+        """
+        lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        self._session_waiters[session_id] = self._session_waiters.get(session_id, 0) + 1
+        try:
+            async with lock:
+                async with self._concurrency:
+                    result = await self.executor(state={"messages": [HumanMessage(content=content)]},
+                                                 config={"configurable": {"session_id": session_id}})
+            return result["messages"]
+        finally:
+            self._session_waiters[session_id] -= 1
+            if not self._session_waiters[session_id]:
+                del self._session_waiters[session_id]
+                del self._session_locks[session_id]
+
+    def __spawn(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def serve_jsonl(self, input_stream=None, output_stream=None) -> None:
+        """
+        Reads turns as JSON lines, {"session_id": ..., "content": ..., "id": optional}, and writes each answer as
+        a JSON line {"id", "session_id", "content"} (or "error") as soon as it is ready. Stops at end of input.
+
+        Args:
+            input_stream (TextIO, optional): Input stream. Default is stdin.
+            output_stream (TextIO, optional): Output stream. Default is stdout.
+        """
+        input_stream = input_stream or sys.stdin
+        output_stream = output_stream or sys.stdout
+        loop = asyncio.get_running_loop()
+        lines: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+        # A daemon thread reads the blocking input, so shutdown never waits on it
+        def read() -> None:
+            for line in input_stream:
+                asyncio.run_coroutine_threadsafe(lines.put(line), loop).result()
+            asyncio.run_coroutine_threadsafe(lines.put(None), loop).result()
+        threading.Thread(target=read, name="jsonl-reader", daemon=True).start()
+
+        def write(payload: dict) -> None:
+            output_stream.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            output_stream.flush()
+
+        async def run(request: dict) -> None:
+            try:
+                answer = await self.__process(request["session_id"], request["content"])
+                write({"id": request.get("id"), "session_id": request["session_id"], "content": answer.content})
+            except Exception as e:
+                write({"id": request.get("id"), "session_id": request.get("session_id"), "error": repr(e)})
+            finally:
+                self.__release()
+
+        while not self.closing:
+            # Backpressure: no more input is read until a turn can be admitted
+            await self.__admit()
+            get_line = loop.create_task(lines.get())
+            stop = loop.create_task(self._stopping.wait())
+            await asyncio.wait({get_line, stop}, return_when=asyncio.FIRST_COMPLETED)
+            stop.cancel()
+            if not get_line.done():
+                get_line.cancel()
+                self.__release()
+                break
+            line = get_line.result()
+            if line is None:
+                self.__release()
+                break
+            if not line.strip():
+                self.__release()
+                continue
+            try:
+                request = json.loads(line)
+                request["session_id"] = str(request.get("session_id", "default"))
+                request["content"]
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                write({"error": f"Invalid request: {e!r}"})
+                self.__release()
+                continue
+            self.__spawn(run(request))
+
+        await self.shutdown()
+
+    async def serve_http(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        """
+        Serves POST /chat with {"session_id", "content"}, GET /health and GET /metrics (Prometheus text,
+        ?format=json for JSON) until stop() is called.
+
+        Args:
+            host (str, optional): Interface to listen on. Default is 127.0.0.1.
+            port (int, optional): Port to listen on. Default is 8080.
+        """
+        # aiohttp is only needed by the HTTP mode
+        from aiohttp import web
+
+        async def chat(request: web.Request) -> web.Response:
+            if self.closing:
+                return web.json_response({"error": "shutting down"}, status=503)
+            if self._admission.locked():
+                return web.json_response({"error": "server busy"}, status=503, headers={"Retry-After": "1"})
+            try:
+                body = await request.json()
+                session_id, content = str(body.get("session_id", "default")), body["content"]
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                return web.json_response({"error": f"Invalid request: {e!r}"}, status=400)
+
+            async def run() -> BaseMessage:
+                try:
+                    return await self.__process(session_id, content)
+                finally:
+                    self.__release()
+
+            await self.__admit()
+            # Shielded, so a client disconnecting does not cut the turn before its history is stored
+            answer = await asyncio.shield(self.__spawn(run()))
+            return web.json_response({"session_id": session_id, "content": answer.content})
+
+        async def health(request: web.Request) -> web.Response:
+            return web.json_response({"status": "closing" if self.closing else "ok",
+                                      "pending": self.pending,
+                                      "sessions": len(self._session_locks)})
+
+        async def metrics(request: web.Request) -> web.Response:
+            registry = MetricsRegistry.shared()
+            if request.query.get("format") == "json":
+                return web.json_response(registry.to_json())
+            return web.Response(text=registry.to_prometheus(), content_type="text/plain")
+
+        app = web.Application()
+        app.add_routes([web.post("/chat", chat), web.get("/health", health), web.get("/metrics", metrics)])
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"[SERVER] Listening on http://{host}:{port}")
+        try:
+            await self._stopping.wait()
+        finally:
+            self.closing = True
+            await self.__drain()
+            await runner.cleanup()
+            await self.shutdown()
+
+    def install_signal_handlers(self) -> None:
+        """
+        Stops the server gracefully on SIGINT and SIGTERM, where the platform supports it.
+        """
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+    def stop(self) -> None:
+        """
+        Stops admitting turns; the serve method then drains and shuts down.
+        """
+        self.closing = True
+        self._stopping.set()
+
+    async def __drain(self) -> None:
+        """
+        Waits for the admitted turns, up to shutdown_timeout seconds.
+        """
+        if self._tasks:
+            logger.info(f"[SERVER] Waiting for {len(self._tasks)} turns to finish.")
+            _, pending = await asyncio.wait(set(self._tasks), timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+
+    async def shutdown(self) -> None:
+        """
+        Waits for the admitted turns and closes the executor and the pooled model clients.
+        """
+        self.closing = True
+        await self.__drain()
+        aclose = getattr(self.executor, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        # Imported here to keep the server independent from the model providers
+        from core.builders.model_pool import ModelPool
+        await ModelPool.aclose()
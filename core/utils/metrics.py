@@ -0,0 +1,348 @@
+import atexit, bisect, json, os, threading, time, weakref
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from loguru import logger
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prefix of every exported metric
+PREFIX = "agent"
+
+class Histogram:
+    # A latency histogram with fixed buckets, exported as Prometheus cumulative buckets
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile by linear interpolation inside its bucket.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The estimated value in seconds.
+        """
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    """
+    Process-wide metrics of the executor pipeline: per-stage latency histograms (history load and write,
+    prompt, model, tools, the whole turn), counters (tokens, retries, errors) and the stats of registered
+    components such as the caches, read when exporting.
+
+    Exported as Prometheus text or JSON, from a local HTTP endpoint (serve), the AgentServer /metrics route
+    or a dump file. METRICS_DUMP_PATH dumps the metrics at exit, as JSON unless the path ends with .prom.
+    """
+
+    _shared: Optional["MetricsRegistry"] = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.collectors: Dict[str, Callable[[], Optional[Dict[str, float]]]] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @classmethod
+    def shared(cls) -> "MetricsRegistry":
+        """
+        Returns the process-wide registry, registering the dump at exit when METRICS_DUMP_PATH is set.
+
+        Returns:
+            MetricsRegistry: The shared registry.
+        """
+        if cls._shared is None:
+            cls._shared = cls()
+            if os.environ.get("METRICS_DUMP_PATH"):
+                atexit.register(cls._shared.dump, os.environ["METRICS_DUMP_PATH"])
+        return cls._shared
+
+    @staticmethod
+    def __key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+    def observe(self, stage: str, seconds: float, **labels) -> None:
+        """
+        Records the latency of a stage.
+
+        Args:
+            stage (str): The stage, e.g. history_load, model, tool.
+            seconds (float): The latency.
+            **labels: Extra labels, e.g. agent or tool.
+        """
+        key = self.__key(stage, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increments a counter.
+
+        Args:
+            name (str): The counter, e.g. tokens, retries, errors.
+            value (float, optional): The increment. Default is 1.
+            **labels: Extra labels.
+        """
+        key = self.__key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, stage: str, **labels) -> Iterator[None]:
+        """
+        Times the enclosed block as a stage, also when it raises. Works around awaits too.
+
+        Args:
+            stage (str): The stage.
+            **labels: Extra labels.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def register(self, component: str, stats: Callable[[], Dict[str, float]]) -> None:
+        """
+        Registers the stats of a component (e.g. a cache), read on every export. Bound methods are held
+        weakly, so registering does not keep the component alive.
+
+        Args:
+            component (str): Name of the component, made unique with a suffix if already taken.
+            stats (Callable[[], Dict[str, float]]): Returns numeric stats such as hits, misses and hit_rate.
+        """
+        if hasattr(stats, "__self__"):
+            method = weakref.WeakMethod(stats)
+            stats = lambda: method()() if method() is not None else None
+        with self._lock:
+            name, index = component, 1
+            while name in self.collectors:
+                index += 1
+                name = f"{component}_{index}"
+            self.collectors[name] = stats
+
+    def __collect(self) -> Dict[str, Dict[str, float]]:
+        """
+        Reads the registered components, dropping the ones that no longer exist.
+        """
+        components = {}
+        for name, stats in list(self.collectors.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                logger.debug(f"[METRICS] Cannot read {name}: {e!r}")
+                continue
+            if values is None:
+                self.collectors.pop(name, None)
+                continue
+            components[name] = {key: value for key, value in values.items() if isinstance(value, (int, float))}
+        return components
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        Returns the metrics as a JSON-serializable dict, with estimated p50/p95/p99 per stage.
+
+        Returns:
+            Dict[str, Any]: Stages, counters and components.
+        """
+        with self._lock:
+            stages = [
+                {"stage": name, **dict(labels), "count": histogram.count, "sum": histogram.sum,
+                 "avg": histogram.sum / histogram.count if histogram.count else 0.0,
+                 "p50": histogram.quantile(0.5), "p95": histogram.quantile(0.95), "p99": histogram.quantile(0.99)}
+                for (name, labels), histogram in self.histograms.items()
+            ]
+            counters = [{"name": name, **dict(labels), "value": value} for (name, labels), value in self.counters.items()]
+        return {"timestamp": time.time(), "stages": stages, "counters": counters, "components": self.__collect()}
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        def labels_text(labels: Tuple[Tuple[str, str], ...]) -> str:
+            escaped = [f'{key}="{value}"'.replace("\n", " ") for key, value in labels]
+            return "{" + ",".join(escaped) + "}" if escaped else ""
+
+        lines: List[str] = [f"# TYPE {PREFIX}_stage_seconds histogram"]
+        with self._lock:
+            for (name, labels), histogram in self.histograms.items():
+                base = (("stage", name),) + labels
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{PREFIX}_stage_seconds_bucket{labels_text(base + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{PREFIX}_stage_seconds_sum{labels_text(base)} {histogram.sum}")
+                lines.append(f"{PREFIX}_stage_seconds_count{labels_text(base)} {histogram.count}")
+            counter_names = sorted({name for name, _ in self.counters})
+            for counter in counter_names:
+                lines.append(f"# TYPE {PREFIX}_{counter}_total counter")
+                for (name, labels), value in self.counters.items():
+                    if name == counter:
+                        lines.append(f"{PREFIX}_{name}_total{labels_text(labels)} {value}")
+        lines.append(f"# TYPE {PREFIX}_component gauge")
+        for component, values in self.__collect().items():
+            for stat, value in values.items():
+                lines.append(f"{PREFIX}_component{labels_text((('component', component), ('stat', stat)))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """
+        Writes the metrics to a file, as Prometheus text if the path ends with .prom, otherwise as JSON.
+
+        Args:
+            path (str): The file path.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            if path.endswith(".prom"):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), file, indent=2)
+
+    def serve(self, host: str = "127.0.0.1", port: int = 9100) -> ThreadingHTTPServer:
+        """
+        Serves GET /metrics (Prometheus text) and GET /metrics?format=json from a daemon thread.
+
+        Args:
+            host (str, optional): The host to bind. Default is 127.0.0.1.
+            port (int, optional): The port to bind. Default is 9100.
+
+        Returns:
+            ThreadingHTTPServer: The running server.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if not self.path.startswith("/metrics"):
+                    self.send_error(404)
+                    return
+                if "format=json" in self.path:
+                    body, content_type = json.dumps(registry.to_json()).encode("utf-8"), "application/json"
+                else:
+                    body, content_type = registry.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics-server").start()
+        logger.info(f"[METRICS] Serving on http://{host}:{port}/metrics")
+        return self._server
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler timing the stages inside a runnable: prompt rendering, model calls and
+    tools, and counting the tokens reported by the provider. The agent label comes from the "agent"
+    metadata of the config, set by RunnableExecutor.
+
+    Attributes:
+        registry (MetricsRegistry): Where the metrics are recorded.
+    """
+
+    # Record on the calling thread, the handler only touches in-memory counters
+    run_inline = True
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry.shared()
+        self._runs: Dict[UUID, Tuple[str, float, Dict[str, Any]]] = {}
+
+    def __start(self, run_id: UUID, stage: str, metadata: Optional[Dict[str, Any]], **labels) -> None:
+        self._runs[run_id] = (stage, time.perf_counter(), {"agent": (metadata or {}).get("agent"), **labels})
+
+    def __end(self, run_id: UUID, error: Optional[BaseException] = None) -> Optional[Dict[str, Any]]:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        stage, start, labels = run
+        self.registry.observe(stage, time.perf_counter() - start, **labels)
+        if error is not None:
+            self.registry.increment("errors", stage=stage, **labels)
+        return labels
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        self.__start(run_id, "model", metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        self.__start(run_id, "model", metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, parent_run_id=None, **kwargs):
+        labels = self.__end(run_id)
+        if labels is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        if prompt_tokens is None:
+            # Streaming and newer providers report the usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    message_usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens = (prompt_tokens or 0) + message_usage.get("input_tokens", 0)
+                    completion_tokens = (completion_tokens or 0) + message_usage.get("output_tokens", 0)
+        if prompt_tokens:
+            self.registry.increment("tokens", prompt_tokens, kind="prompt", **labels)
+        if completion_tokens:
+            self.registry.increment("tokens", completion_tokens, kind="completion", **labels)
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self.__end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        self.__start(run_id, "tool", metadata, tool=(serialized or {}).get("name") or kwargs.get("name"))
+
+    def on_tool_end(self, output, *, run_id, parent_run_id=None, **kwargs):
+        self.__end(run_id)
+
+    def on_tool_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self.__end(run_id, error)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        # Only the prompt templates are timed, the chains around them are timed by the executors
+        name = kwargs.get("name") or ((serialized or {}).get("id") or [""])[-1]
+        if name.endswith("PromptTemplate"):
+            self.__start(run_id, "prompt", metadata)
+
+    def on_chain_end(self, outputs, *, run_id, parent_run_id=None, **kwargs):
+        self.__end(run_id)
+
+    def on_chain_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self.__end(run_id, error)
@@ -0,0 +1,82 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterable, Optional
+from langchain_core.messages import BaseMessage
+from loguru import logger
+
+if TYPE_CHECKING:
+    import tiktoken
+
+# Approximate per-message overhead added by the chat format (role and separators)
+TOKENS_PER_MESSAGE = 4
+
+# Rough characters per token, used only when the tiktoken encoding cannot be loaded (e.g. offline)
+CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=None)
+def get_encoding(model: Optional[str] = None) -> Optional["tiktoken.Encoding"]:
+    """
+    Returns the tiktoken encoding for the model, loaded only once per process.
+
+    Args:
+        model (Optional[str]): Model name. Unknown or missing models fall back to o200k_base.
+
+    Returns:
+        Optional[tiktoken.Encoding]: The encoding used to count tokens, or None if it cannot be loaded.
+    """
+    try:
+        # Imported with the first count, tiktoken is only needed once a prompt is counted
+        import tiktoken
+        if model:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.debug(f"[TOKEN_COUNTER] Encoding unavailable, using an approximation: {e}")
+        return None
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Counts the tokens of a text.
+
+    Args:
+        text (str): The text to count.
+        model (Optional[str]): Model name used to pick the encoding.
+
+    Returns:
+        int: Number of tokens.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(message: BaseMessage, model: Optional[str] = None) -> int:
+    """
+    Counts the tokens of a chat message, including the per-message overhead.
+
+    Args:
+        message (BaseMessage): The message to count.
+        model (Optional[str]): Model name used to pick the encoding.
+
+    Returns:
+        int: Number of tokens.
+    """
+    content = message.content
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return TOKENS_PER_MESSAGE + count_tokens(content, model)
+
+def count_messages_tokens(messages: Iterable[BaseMessage], model: Optional[str] = None) -> int:
+    """
+    Counts the tokens of a list of chat messages.
+
+    Args:
+        messages (Iterable[BaseMessage]): The messages to count.
+        model (Optional[str]): Model name used to pick the encoding.
+
+    Returns:
+        int: Number of tokens.
+    """
+    return sum(count_message_tokens(message, model) for message in messages)
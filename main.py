@@ -1,26 +1,64 @@
-import os, sys
-from app.agents.scrapper_agent import scrapper
+import os, sys, asyncio, argparse
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage
-from loguru import logger
 
-# Load environment variables from a .env file
+# Load environment variables from a .env file, before any module reads its configuration
 load_dotenv()
 
-# Load session_id from parameter, otherwise set default session_id
-args = sys.argv[1:]
-if len(args) == 1:
-    session_id=args[0]
-else:
-    session_id="default"
-
-# Run an infinite loop to continuously take user input
-while True:
-    prompt = input("?> ")
-    # If the user provided a prompt, process it with the scrapper agent
-    if prompt:
-        response = scrapper.runnable.invoke(
+from app.agents.scrapper_agent import get_scrapper
+from core.server.agent_server import AgentServer
+from core.utils.metrics import MetricsRegistry
+from langchain_core.messages import HumanMessage
+from loguru import logger
+
+# Load session_id from parameter, otherwise set default session_id; --serve runs a multi-session server instead
+parser = argparse.ArgumentParser()
+parser.add_argument("session_id", nargs="?", default="default")
+parser.add_argument("--serve", choices=["http", "jsonl"], help="Serve many sessions concurrently instead of the REPL")
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8080)
+parser.add_argument("--max-concurrency", type=int, default=int(os.environ.get("AGENT_MAX_CONCURRENCY", 32)))
+parser.add_argument("--max-pending", type=int, default=int(os.environ.get("AGENT_MAX_PENDING", 1024)))
+parser.add_argument("--metrics-port", type=int, default=int(os.environ.get("METRICS_PORT", 0)),
+                    help="Serve the metrics on this port, besides /metrics of the HTTP server")
+async def answer(prompt: str) -> None:
+    # Stream the agent's response to the terminal as it is generated
+    print("IA> ", end="", flush=True)
+    response = None
+    async for chunk in get_scrapper().astream(
             config={"configurable":{"session_id":session_id}},
-            input={"messages": [HumanMessage(content=prompt)]})
-        logger.debug(response)
-        print(f"IA> {response.content}")  # Print the agent's response
+            state={"messages": [HumanMessage(content=prompt)]}):
+        response = chunk if response is None else response + chunk
+        print(chunk.content, end="", flush=True)
+    print()
+    logger.debug(response)
+
+async def main() -> None:
+    # Run an infinite loop to continuously take user input, on a single event loop so the pooled
+    # HTTP connections to the model provider are reused between turns
+    while True:
+        prompt = await asyncio.to_thread(input, "?> ")
+        # If the user provided a prompt, process it with the scrapper agent
+        if prompt:
+            await answer(prompt)
+
+async def serve() -> None:
+    # Serve many sessions concurrently through the executor, with graceful shutdown on SIGINT/SIGTERM
+    server = AgentServer(get_scrapper(), max_concurrency=args.max_concurrency, max_pending=args.max_pending)
+    server.install_signal_handlers()
+    if args.serve == "http":
+        await server.serve_http(host=args.host, port=args.port)
+    else:
+        # Logs go to stderr so stdout only carries the JSON lines
+        logger.remove()
+        logger.add(sys.stderr, level="INFO")
+        await server.serve_jsonl()
+
+# The guard keeps the tool worker processes, which import this module, from running the agent
+if __name__ == "__main__":
+    args = parser.parse_args()
+    session_id = args.session_id
+
+    if args.metrics_port:
+        MetricsRegistry.shared().serve(port=args.metrics_port)
+
+    asyncio.run(serve() if args.serve else main())